@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+# env/AHN3
+
+# author: arkriger - https://github.com/AdrianKriger/aerialPhotogrammetry101/tree/main/aerial101
+
+"""
+The processing shared by every dataset folder:
+    - aerial101.cloud: PDAL ingestion, classification and the cached PointStore
+    - aerial101.raster: startin / idw engines and the GeoTIFF (COG) writers
+    - aerial101.dtm_dsm: the dtm/dsm procedure run by the {dataset}_Main.py scripts
+    - aerial101.pipeline: the openMVG/openMVS step runner of the MvgMvsPipeline_*.py scripts
+
+What differs per dataset is configuration: its params.json (e.g. "thinning", "crop")
+and the step options in its pipeline.json.
+
+The names below are imported from their module on first use, so importing the
+runner does not require PDAL, startin or rasterio.
+"""
+
+_EXPORTS = {
+    'cloud': ['get_ply', 'get_ply_stream', 'grid_params', 'POINT_DTYPE', 'PointStore',
+              'create_store', 'open_store', 'cache_load', 'cache_save', 'thinning_stages',
+              'crop_stages', 'ground_stages', 'clsy_pipe', 'clsy_tiled'],
+    'raster': ['execute_startin', 'execute_startin_batch', 'execute_startin_blocks', 'execute_startin_sizes', 'grid_sizes',
+               'execute_startin_fill', 'tin_fill',
+               'ground_points', 'insertion_order', 'build_tin', 'ground_tin', 'tin_key', 'tin_save', 'tin_read', 'tin_load', 'StoredTIN',
+               'execute_idwquad', 'execute_idwquad_batch', 'execute_idwquad_blocks',
+               'execute_tiled', 'RasterBlocks', 'write_geotiff', 'write_cog', 'write_raster',
+               'pdal_idw'],
+}
+_MODULES = {name: module for module, names in _EXPORTS.items() for name in names}
+
+__all__ = list(_MODULES)
+
+
+def __getattr__(name):
+    if name not in _MODULES:
+        raise AttributeError("module 'aerial101' has no attribute %r" % name)
+    import importlib
+    return getattr(importlib.import_module('.' + _MODULES[name], __name__), name)
@@ -0,0 +1,485 @@
+# -*- coding: utf-8 -*-
+# env/ANH3
+
+
+# author: arkriger - https://github.com/AdrianKriger/aerialPhotogrammetry101/tree/main/aerial101
+
+# - the point cloud half of the dtm/dsm procedure, shared by every dataset:
+#     - PDAL pipeline: reproject from ecef geocentric to utm, thin, low noise, outliers,
+#       ground filtering, write .las
+#     - the classified cloud cached as a memory-mapped PointStore
+# - what differs per dataset is set in its params.json:
+#     - "thinning": poisson sample the cloud by "thinning-factor"
+#     - "crop": crop the classified cloud to "bounds" once the .las is written
+
+import math
+import json
+import hashlib
+import os
+import time
+from datetime import timedelta
+import numpy as np
+
+def get_ply(fpath, jparams):#, gnd_only = False):
+    """Takes the filepath to an input ply file and the
+    desired output raster cell size. Reads the ply file, performs basic cleaning, 
+    reprojects, ground filtering, transforms to a 
+    .las and outputs the ground points as a numpy array. 
+    Also establishes some basic raster parameters:
+        - the extents
+        - the resolution in coordinates
+        - the coordinate location of the relative origin (bottom left)
+    """
+    
+    #Import LAS into numpy array 
+    array = cache_load(fpath, jparams) if jparams["cache"] == "True" else None
+    if array is None:
+        start = time.time()
+        classify = clsy_tiled if jparams["pdal-tiled"] == "True" else clsy_pipe
+        array = classify(fpath, jparams)
+        if jparams["cache"] == "True":
+            array = cache_save(fpath, jparams, array, time.time() - start)
+    
+    #-- extents straight from the columns; no copies
+    extent = [[array['X'].min(), array['X'].max()],
+              [array['Y'].min(), array['Y'].max()]]
+    res, origin, ul_origin = grid_params(extent, jparams["size"])
+    
+    # if gnd_only == True:
+    #     array = array[(array['Classification'] == 2) & (array['Classification'] != 7)]
+    #     #in_np = np.vstack((ground['X'], ground['Y'], ground['Z'])).T
+    # else:
+    #     # don't .T here. 
+    #     # ~ .T inside the various functions so that pdal_idw does not have to read the file
+    #     array = array[array['Classification'] != 7]
+        
+    return array, res, origin, ul_origin
+
+#-- the dimensions the raster engines read; all the stream keeps per point
+POINT_DTYPE = np.dtype([('X', '<f8'), ('Y', '<f8'), ('Z', '<f8'),
+                        ('Classification', 'u1')])
+
+def grid_params(extent, size):
+    """Takes the [[minx, maxx], [miny, maxy]] extent and the cell size.
+    Returns the raster resolution, the (bottom left) origin and the
+    upper left origin.
+    """
+    res = [math.ceil((extent[0][1] - extent[0][0]) / size),
+           math.ceil((extent[1][1] - extent[1][0]) / size)]
+    origin = [np.mean(extent[0]) - (size / 2) * res[0],
+              np.mean(extent[1]) - (size / 2) * res[1]]
+    ul_origin = [np.mean(extent[0]) - (size / 2) * res[0],
+                 np.mean(extent[1]) + (size / 2) * res[1]]
+    return res, origin, ul_origin
+
+class PointStore:
+    """Columnar on-disk store of a classified cloud: one raw file per
+    POINT_DTYPE dimension (float64 X, Y, Z and uint8 Classification)
+    plus a store.json header, opened as np.memmap. Indexing with a
+    dimension name returns its column zero-copy; indexing with a mask
+    or slice returns a PointStore of the selection. The raster engines
+    consume it in place of the PDAL structured array.
+    """
+    def __init__(self, columns):
+        self.columns = columns
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self.columns[key]
+        return PointStore({dim: col[key] for dim, col in self.columns.items()})
+
+    def __setitem__(self, dim, values):
+        self.columns[dim][...] = values
+
+    def __len__(self):
+        return len(self.columns['X'])
+
+    @property
+    def size(self):
+        return len(self)
+
+    def structured(self):
+        """Copies the columns into a POINT_DTYPE structured array."""
+        array = np.empty(self.size, dtype=POINT_DTYPE)
+        for dim in POINT_DTYPE.names: array[dim] = self.columns[dim]
+        return array
+
+def create_store(path, n):
+    """Allocates a writable PointStore of n points in directory path.
+    Any previous header is removed, so the store only becomes valid
+    once cache_save has written its new one.
+    """
+    os.makedirs(path, exist_ok=True)
+    if os.path.exists(os.path.join(path, 'store.json')):
+        os.remove(os.path.join(path, 'store.json'))
+    return PointStore({dim: np.memmap(os.path.join(path, dim + '.bin'), mode='w+',
+                                      dtype=POINT_DTYPE[dim], shape=(max(n, 1),))[:n]
+                       for dim in POINT_DTYPE.names})
+
+def open_store(path):
+    """Opens the PointStore in directory path read-only."""
+    with open(os.path.join(path, 'store.json')) as f:
+        n = json.load(f)["count"]
+    if n == 0:
+        return PointStore({dim: np.empty(0, dtype=POINT_DTYPE[dim]) for dim in POINT_DTYPE.names})
+    return PointStore({dim: np.memmap(os.path.join(path, dim + '.bin'), mode='r',
+                                      dtype=POINT_DTYPE[dim], shape=(n,))
+                       for dim in POINT_DTYPE.names})
+
+#-- the params.json entries that change the classified cloud
+CACHE_PARAMS = ["thinning", "thinning-factor", "crop", "initial_distance", "max_distance", "crs", "bounds",
+                "pdal-tiled", "pdal-tile-size", "pdal-tile-buffer"]
+
+def cache_key(fpath, jparams):
+    """Hashes the input ply (path, size and modification time) together
+    with the PDAL stage parameters into the key of its classified cloud.
+    """
+    st = os.stat(fpath)
+    key = {"input": os.path.abspath(fpath), "bytes": st.st_size, "mtime": st.st_mtime_ns,
+           "params": {k: jparams.get(k) for k in CACHE_PARAMS}}
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+def cache_path(jparams):
+    """The PointStore directory holding the cached classified cloud next to 'out-las'."""
+    return os.path.splitext(jparams['out-las'])[0] + '_store'
+
+def cache_load(fpath, jparams):
+    """Returns the cached classified cloud (a memory-mapped PointStore)
+    of the input ply if its key matches, else None. Reports hit or miss
+    and the time saved against the classification run that filled it.
+    """
+    start = time.time()
+    header = os.path.join(cache_path(jparams), 'store.json')
+    if os.path.exists(header):
+        with open(header) as f:
+            meta = json.load(f)
+        if meta["key"] == cache_key(fpath, jparams):
+            array = open_store(cache_path(jparams))
+            saved = meta["seconds"] - (time.time() - start)
+            print('cache hit:', cache_path(jparams), '- saved', str(timedelta(seconds=saved)))
+            return array
+    print('cache miss:', cache_path(jparams))
+    return None
+
+def cache_save(fpath, jparams, array, seconds):
+    """Writes X, Y, Z and Classification of the classified cloud to the
+    cache PointStore (unless array already is that store, as filled by
+    get_ply_stream) with a header holding its key and the seconds the
+    classification took. Returns the store, opened read-only.
+    """
+    if not isinstance(array, PointStore):
+        store = create_store(cache_path(jparams), array.size)
+        for dim in POINT_DTYPE.names: store[dim] = array[dim]
+        array = store
+    for col in array.columns.values(): col.flush()
+    with open(os.path.join(cache_path(jparams), 'store.json'), 'w') as f:
+        json.dump({"count": array.size, "key": cache_key(fpath, jparams),
+                   "seconds": seconds}, f)
+    return open_store(cache_path(jparams))
+
+def get_ply_stream(fpath, jparams):
+    """Streaming counterpart of get_ply for clouds larger than RAM.
+    The classification pipeline writes 'out-las' without its points
+    being pulled into Python; the .las is then read back in streaming
+    mode, jparams["chunk-size"] points at a time. Each chunk is reduced
+    to POINT_DTYPE straight into the memory-mapped point store next to
+    'out-las' and the extents are updated incrementally, so neither the
+    full PDAL structured array nor the cloud itself is held in RAM.
+    Like get_ply it is served from the cache when jparams["cache"] is on;
+    with the cache off the store is written all the same, only without
+    the header that would make it a cache entry.
+    """
+    import pdal
+
+    array = cache_load(fpath, jparams) if jparams["cache"] == "True" else None
+    if array is not None:
+        extent = [[array['X'].min(), array['X'].max()],
+                  [array['Y'].min(), array['Y'].max()]]
+    else:
+        start = time.time()
+        classify = clsy_tiled if jparams["pdal-tiled"] == "True" else clsy_pipe
+        classify(fpath, jparams, arrays=False)
+    
+        #-- clsy_pipe and clsy_tiled crop after writing the .las; crop the stream the same way
+        reader = pdal.Pipeline(json.dumps({"pipeline": [jparams['out-las'], *crop_stages(jparams)]}))
+        n = reader.quickinfo['readers.las']['num_points']
+        array = create_store(cache_path(jparams), n)
+        lo, hi, i = np.full(2, np.inf), np.full(2, -np.inf), 0
+        for chunk in reader.iterator(chunk_size=jparams["chunk-size"]):
+            if chunk.size == 0:
+                continue
+            part = array[i:i + chunk.size]
+            for dim in POINT_DTYPE.names: part[dim] = chunk[dim]
+            lo = np.minimum(lo, [part['X'].min(), part['Y'].min()])
+            hi = np.maximum(hi, [part['X'].max(), part['Y'].max()])
+            i += chunk.size
+        array = array[:i]
+        extent = [[lo[0], hi[0]], [lo[1], hi[1]]]
+        if jparams["cache"] == "True":
+            array = cache_save(fpath, jparams, array, time.time() - start)
+    res, origin, ul_origin = grid_params(extent, jparams["size"])
+    
+    return array, res, origin, ul_origin
+
+def thinning_stages(jparams):
+    """The poisson sampling stage, thinning the cloud to points at least
+    jparams['thinning-factor'] apart, when jparams["thinning"] is on.
+    """
+    if jparams["thinning"] != "True":
+        return []
+    return [
+            {
+                "type":"filters.sample",
+                "radius": jparams['thinning-factor']
+            }
+           ]
+
+def crop_stages(jparams):
+    """The crop to jparams['bounds'] when jparams["crop"] is on. Placed
+    after writers.las so the .las keeps the whole cloud.
+    """
+    if jparams["crop"] != "True":
+        return []
+    return [
+            {
+                "type":"filters.crop",
+                "bounds": jparams['bounds']
+            }
+           ]
+
+def ground_stages(jparams):
+    """The low noise, outlier and ground filtering stages shared by
+    clsy_pipe and the per-tile pipelines of clsy_tiled.
+    """
+    return [
+            {
+                "type":"filters.elm"
+            },
+            {
+                "type":"filters.outlier",
+                "method":"statistical",
+                "mean_k": 12,
+                "multiplier": 1.2
+            },
+            {
+                "type":"filters.pmf",
+                #"slope": jparams["gf-angle"],
+                "ignore":"Classification[7:7]",
+                "initial_distance": jparams['initial_distance'],
+                "max_distance": jparams['max_distance'],
+                "max_window_size": jparams['initial_distance'] + 20
+            },
+            {
+                "type":"filters.range",
+                "limits":"Classification[1:2]"
+            }
+           ]
+
+def clsy_pipe(ply, jparams, arrays=True):
+    """
+    pdal pipeline to read .las, poisson resample, identify low noise, identify outliers, 
+    classify ground and non-ground 
+    ~ refine the classification with a nearest neighbor search and write the result as a .las
+    ~ arrays=False only writes the .las and returns the point count
+    """
+    import pdal
+   
+    pline={
+        "pipeline": [
+            {
+                "type": "readers.ply",
+                "filename": ply,
+                "default_srs": "+proj=geocent +ellps=WGS84 +datum=WGS84 +no_defs"
+            },
+            *thinning_stages(jparams),
+            {
+                "type":"filters.reprojection",
+                "in_srs":"+proj=geocent +ellps=WGS84 +datum=WGS84 +no_defs",
+                "out_srs": jparams['crs']
+            },
+            *ground_stages(jparams),
+            # {
+            #     "type" : "filters.neighborclassifier",
+            #     "domain" : "Classification[2:2]",
+            #     "k" : 7
+            # },
+            # {
+            #      "type": "filters.approximatecoplanar",
+            #      "knn": 10
+            # },
+            # {
+            #     "type":"filters.estimaterank",
+            # },
+            {
+                "type":"writers.las",
+                "filename": jparams['out-las']
+            },
+            *crop_stages(jparams)
+          ]
+        } 
+    
+    pipeline = pdal.Pipeline(json.dumps(pline))
+    #pipeline.validate() 
+    count = pipeline.execute()
+    if not arrays:
+        return count
+    array = pipeline.arrays[0]
+    
+    return array
+
+#-- keep full precision in the intermediate tile files
+LAS_AUTO_SCALE = {"scale_x": "auto", "scale_y": "auto", "scale_z": "auto",
+                  "offset_x": "auto", "offset_y": "auto", "offset_z": "auto"}
+
+def split_tiles(reproj, tiles):
+    """Splits the reprojected cloud into its buffered tiles in one pass:
+    the .las is read once and every (bounds, core, buffered file, ...)
+    tile gets its own crop and writer branch, so the classification
+    workers each read no more than their tile.
+    """
+    import pdal
+
+    pline={
+        "pipeline": [
+            {
+                "type":"readers.las",
+                "filename": reproj,
+                "tag": "reproj"
+            }
+          ]
+        }
+    for i, (bounds, _, fbuf, _) in enumerate(tiles):
+        pline["pipeline"] += [
+            {
+                "type":"filters.crop",
+                "inputs": ["reproj"],
+                "bounds": "([%r, %r],[%r, %r])" % bounds,
+                "tag": "crop_%d" % i
+            },
+            {
+                "type":"writers.las",
+                "inputs": ["crop_%d" % i],
+                "filename": fbuf,
+                **LAS_AUTO_SCALE,
+                "tag": "tile_%d" % i
+            }
+          ]
+    #-- joins the writer branches into a single leaf stage; merging views copies no points
+    pline["pipeline"].append({
+                "type":"filters.merge",
+                "inputs": ["tile_%d" % i for i in range(len(tiles))]
+            })
+    
+    return pdal.Pipeline(json.dumps(pline)).execute()
+
+def clsy_tile(fbuf, core, fpath, jparams):
+    """Classifies one tile: runs the ground_stages on the buffered tile
+    written by split_tiles and keeps the points of the half-open core
+    [minx, maxx) x [miny, maxy) so that neighbouring tiles share no
+    points. Runs in a worker process of clsy_tiled and returns the
+    number of points written to fpath.
+    """
+    import pdal
+
+    pline={
+        "pipeline": [
+            fbuf,
+            *ground_stages(jparams),
+            {
+                "type":"filters.range",
+                "limits":"X[%r:%r),Y[%r:%r)" % core
+            },
+            {
+                "type":"writers.las",
+                "filename": fpath,
+                **LAS_AUTO_SCALE
+            }
+          ]
+        }
+    
+    return pdal.Pipeline(json.dumps(pline)).execute()
+
+def clsy_tiled(ply, jparams, arrays=True):
+    """Tiled counterpart of clsy_pipe for large flights. The cloud is
+    read, thinned and reprojected once; the slow low noise, outlier and
+    ground filtering then run per XY tile of jparams["pdal-tile-size"]
+    metres, buffered by jparams["pdal-tile-buffer"] metres (at least
+    the pmf max_window_size), in a pool of jparams["pdal-workers"]
+    processes. The buffered tiles are split off the reprojected cloud
+    in one pass beforehand (see split_tiles), so no worker loads more
+    than its tile. The buffer points are dropped and the classified
+    tiles merged into 'out-las'.
+    """
+    import shutil
+    import tempfile
+    from concurrent.futures import ProcessPoolExecutor
+
+    import pdal
+    
+    #-- a private folder next to 'out-las' for the intermediate files; removed however the run ends
+    tdir = tempfile.mkdtemp(prefix='tiles_', dir=os.path.dirname(jparams['out-las']) or '.')
+    try:
+        reproj = os.path.join(tdir, 'reproj.las')
+        pline={
+            "pipeline": [
+                {
+                    "type": "readers.ply",
+                    "filename": ply,
+                    "default_srs": "+proj=geocent +ellps=WGS84 +datum=WGS84 +no_defs"
+                },
+                *thinning_stages(jparams),
+                {
+                    "type":"filters.reprojection",
+                    "in_srs":"+proj=geocent +ellps=WGS84 +datum=WGS84 +no_defs",
+                    "out_srs": jparams['crs']
+                },
+                {
+                    "type":"writers.las",
+                    "filename": reproj,
+                    **LAS_AUTO_SCALE
+                }
+              ]
+            }
+        pdal.Pipeline(json.dumps(pline)).execute()
+    
+        b = pdal.Pipeline(json.dumps({"pipeline": [reproj]})).quickinfo['readers.las']['bounds']
+        t, buf = jparams["pdal-tile-size"], jparams["pdal-tile-buffer"]
+        #-- shared tile edges; the last ones reach past the max bound
+        xe = [b['minx'] + i * t for i in range(math.ceil((b['maxx'] - b['minx']) / t) or 1)]
+        ye = [b['miny'] + i * t for i in range(math.ceil((b['maxy'] - b['miny']) / t) or 1)]
+        xe.append(b['maxx'] + 1); ye.append(b['maxy'] + 1)
+        tiles = []
+        for i in range(len(xe) - 1):
+            for j in range(len(ye) - 1):
+                core = (xe[i], xe[i + 1], ye[j], ye[j + 1])
+                bounds = (xe[i] - buf, xe[i + 1] + buf, ye[j] - buf, ye[j + 1] + buf)
+                tiles.append((bounds, core, os.path.join(tdir, 'buffer_%d_%d.las' % (i, j)),
+                              os.path.join(tdir, 'tile_%d_%d.las' % (i, j))))
+        split_tiles(reproj, tiles)
+    
+        with ProcessPoolExecutor(max_workers=jparams["pdal-workers"]) as pool:
+            jobs = [pool.submit(clsy_tile, fb, co, fp, jparams) for _, co, fb, fp in tiles]
+            counts = [job.result() for job in jobs]
+    
+        pline={
+            "pipeline": [fp for (_, _, _, fp), n in zip(tiles, counts) if n > 0] + [
+                {
+                    "type":"filters.merge"
+                },
+                {
+                    "type":"writers.las",
+                    "filename": jparams['out-las']
+                },
+                *crop_stages(jparams)
+              ]
+            }
+    
+        pipeline = pdal.Pipeline(json.dumps(pline))
+        count = pipeline.execute()
+    finally:
+        shutil.rmtree(tdir, ignore_errors=True)
+    if not arrays:
+        return count
+    array = pipeline.arrays[0]
+    
+    return array
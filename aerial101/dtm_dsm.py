@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+# env/AHN3
+
+#author: arkriger - https://github.com/AdrianKriger/aerialPhotogrammetry101/edit/main/aerial101/dtm_dsm.py
+
+# - takes the .ply and executes aerial101.cloud and aerial101.raster; that is:
+# - enter PDAL pipeline (project from ecef geocentric to utm, [thin], outlier removal, 
+#                        ground filtering, write .las -> [crop])
+# - AHN3 dtm and dsm procedure: (https://github.com/khalhoz/geo1101-ahn3-GF-and-Interpolation) 
+#     - dtm: delaunay triangulation with laplace interpolation(startin);
+#            its TIN is kept as .npz ("tin-cache") and rasterised at each "dtm-sizes" cell size
+#            (a kept TIN feeds the "startin-TINfill" engine as is)
+#            the "tiled" engine triangulates each tile on its own: it keeps no TIN ("tin-cache" has
+#            no effect) and repeats the triangulation at each "dtm-sizes" cell size
+#            its ground points are inserted along a "tin-order" curve (morton, hilbert or raw)
+#     - dsm: quad-based idw
+# - run by the {dataset}_Main.py scripts from the dataset folder; params.json sets what differs
+#
+
+import os 
+import json
+from pathlib import Path
+
+import time
+from datetime import timedelta
+
+from .cloud import get_ply, get_ply_stream
+from .raster import (execute_startin, execute_startin_batch, execute_startin_blocks, execute_startin_sizes,
+                     grid_sizes, ground_tin, TIN_ORDER, cpu_budget, execute_idwquad, execute_idwquad_batch, execute_idwquad_blocks,
+                     execute_tiled, write_raster)
+
+def main(params='params.json'):
+    """Runs the dtm/dsm procedure configured by a dataset's params.json;
+    its paths are relative to the working directory.
+    """
+    start = time.time()
+    
+    jparams = json.load(open(params))
+    #-- flights run side by side (batch_flights.py) each get a share of the cores
+    if cpu_budget():
+        for k in ("workers", "pdal-workers"):
+            jparams[k] = max(1, min(jparams[k], cpu_budget()))
+    
+    #-- make a .las folder
+    path = os.getcwd()
+    # Joins the folder that we wanted to create
+    folder_name = 'result_utm/las/'
+    path = os.path.join(path, folder_name) 
+    # Creates the folder, and checks if it is created or not.
+    os.makedirs(path, exist_ok=True)
+    
+    infile = jparams["input-ply"]
+    ingest = get_ply_stream if jparams["stream"] == "True" else get_ply
+    array, res, origin, ul_origin = ingest(infile, jparams)
+    
+    if jparams["dtm"] == "True":
+        name = Path(infile).stem + '_dtm'
+        #-- "startin-TINfill": the TIN-linear surface rasterised per triangle
+        method = jparams.get("dtm-method", 'startin-Laplace')
+        surface = '_tinLaplace.tif' if method == 'startin-Laplace' else '_tinLinear.tif'
+        
+        sizes = jparams.get("dtm-sizes", [jparams["size"]])
+        if jparams["engine"] == "tiled":
+            #-- every tile triangulates its own points, at every cell size
+            if jparams.get("tin-cache") == "True":
+                print('tin-cache: no TIN is kept with the tiled engine')
+            rasters = ((size, res_s, origin_s, execute_tiled(array, res_s, origin_s, size, method, jparams))
+                       for size, res_s, origin_s in grid_sizes(array, sizes))
+        else:
+            startin = {"loop": execute_startin, "batch": execute_startin_batch,
+                       "blocks": execute_startin_blocks}[jparams["engine"]]
+            #-- one triangulation for every cell size; kept as .npz for the next run
+            tinLap = ground_tin(array, jparams["dtm_dsm"] + name + '_TIN.npz'
+                                if jparams.get("tin-cache") == "True" else None,
+                                order=jparams.get("tin-order", TIN_ORDER))
+            rasters = execute_startin_sizes(array, sizes, method, engine=startin, tin=tinLap)
+        for size, res_s, origin_s, rasLap in rasters:
+            suffix = '_%gm' % size if len(sizes) > 1 else ''
+            write_raster(rasLap, origin_s, size, jparams["crs"],
+                         jparams["dtm_dsm"] + name + suffix + surface, jparams)
+        if jparams["engine"] != "tiled":
+            tinLap.write_obj(jparams["dtm_dsm"] + name + '_TINlaplace.obj')
+        
+    if jparams["dsm"] == "True":
+        name = Path(infile).stem + '_dsm'
+        
+        if jparams["engine"] == "tiled":
+            ras = execute_tiled(array, res, origin, jparams["size"], 'idwquad', jparams)
+        else:
+            idwquad = {"loop": execute_idwquad, "batch": execute_idwquad_batch,
+                       "blocks": execute_idwquad_blocks}[jparams["engine"]]
+            ras = idwquad(array, res, origin, jparams["size"],
+                          jparams["start_rk"], jparams["pwr"], jparams["minp"], 
+                          jparams["incr_rk"], jparams["method"], jparams["tolerance"], 
+                          jparams["maxiter"])
+        write_raster(ras, origin, jparams["size"], jparams["crs"], jparams["dtm_dsm"] + name + '_idwQUAD.tif', jparams)
+        
+        # array = array[array['Classification'] != 7]
+        # pdal_idw(array, res, origin, name, jparams)
+        
+    #-- timeit
+    end = time.time()
+    print('runtime:', str(timedelta(seconds=(end - start))))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1403 @@
+#!/usr/bin/python3
+# env/AHN3
+# -*- encoding: utf-8 -*-
+#
+# Created by FlachyJoe - https://github.com/FlachyJoe at https://github.com/cdcseacave/openMVS/blob/master/MvgMvsPipeline.py
+# edit: arkriger - https://github.com/AdrianKriger/aerialPhotogrammetry101/edit/main/aerial101/pipeline.py
+
+## -- the step runner shared by the {dataset}/MvgMvsPipeline_*.py scripts; each passes its
+##    pipeline.json of step options that differ from the defaults below
+## -- python -m aerial101.pipeline C:\Adrian\openMVG_MVS\senseFly_127\images C:\Adrian\openMVG_MVS\senseFly_127\result_utm
+
+"""
+This script is for an easy use of OpenMVG and OpenMVS
+
+usage: MvgMvs_Pipeline.py [-h] [--steps STEPS [STEPS ...]] [--preset PRESET] [--force]
+                          [--cpu-budget CPU_BUDGET] [--subscene-workers N]
+                          [--profile {auto,none,laptop,workstation,node}]
+                          [--dry-run] [--plan] [--calibration FILE] [--verbose]
+                          [--rediscover]
+                          [--0 0 [0 ...]] [--1 1 [1 ...]] [--2 2 [2 ...]]
+                          [--3 3 [3 ...]] [--4 4 [4 ...]] [--5 5 [5 ...]]
+                          [--6 6 [6 ...]] [--7 7 [7 ...]] [--8 8 [8 ...]]
+                          [--9 9 [9 ...]] [--10 10 [10 ...]] [--11 11 [11 ...]]
+                          [--12 12 [12 ...]] [--13 13 [13 ...]]
+                          [--14 14 [14 ...]] [--15 15 [15 ...]]
+                          input_dir output_dir
+
+Photogrammetry reconstruction with these steps:
+    0. Intrinsics analysis             openMVG_main_SfMInit_ImageListing
+    1. Compute features                openMVG_main_ComputeFeatures
+    2. Matching Pair List              openMVG_main_ListMatchingPairs
+    3. Compute matches                 openMVG_main_ComputeMatches
+    4. Incremental reconstruction      openMVG_main_IncrementalSfM
+    5. Global reconstruction           openMVG_main_GlobalSfM
+    6. Colorize Structure              openMVG_main_ComputeSfM_DataColor
+    7. Structure from Known Poses      openMVG_main_ComputeStructureFromKnownPoses
+    8. Color                           openMVG_main_ComputeSfM_DataColor
+    9. Aerial GPS                      openMVG_main_geodesy_registration_to_gps_position
+    10. Control Points Registration    ui_openMVG_control_points_registration
+    11. Export to openMVS              openMVG_main_openMVG2openMVS
+    12. Densify point-cloud            DensifyPointCloud
+    13. Densify point-cloud            DensifyPointCloud
+    14. Split scene                    DensifyPointCloud
+    15. Densify sub-scenes             DensifyPointCloud
+    16. Estimate disparity-maps        DensifyPointCloud
+    17. Fuse disparity-maps            DensifyPointCloud
+    18. Reconstruct the mesh           ReconstructMesh
+    19. Refine the mesh                RefineMesh
+    20. Texture the mesh               TextureMesh
+    21. Merge scene                    DensifyPointCloud
+
+
+positional arguments:
+  input_dir                 the directory which contains the pictures set.
+  output_dir                the directory which will contain the resulting files.
+
+optional arguments:
+  -h, --help                show this help message and exit
+  --steps STEPS [STEPS ...] steps to process
+  --preset PRESET           steps list preset in
+                            SEQUENTIAL = [0, 1, 2, 3, 9, 10, 11, 12, 13]
+                            GLOBAL = [0, 1, 2, 4, 9, 10, 11, 12, 13]
+                            MVG_SEQ = [0, 1, 2, 3, 5, 6, 7]
+                            MVG_GLOBAL = [0, 1, 2, 4, 5, 6, 7]
+                            MVS_SGM = [14, 15, 21]
+                            SEQ_geo = [0, 1, 2, 3, 4, 6, 9, 11, 12]
+                            SEQ_geoMesh = [18, 19, 20]
+                            default : SEQ_geo
+  --force                   rerun the steps already completed in output_dir
+  --cpu-budget CPU_BUDGET   CPUs shared by steps run concurrently (default: all
+                            the cgroup/affinity allows)
+  --profile PROFILE         threads, --resolution-level and matching cache per
+                            machine class, picked from memory by default
+  --subscene-workers N      sub-scenes densified at the same time in step 15
+  --dry-run                 print the commandlines and their order, run nothing
+  --plan                    print the estimated wall time, peak memory and disk
+                            written per step, run nothing
+  --calibration FILE        the per-step costs of the earlier runs --plan scales
+                            (~/.cache/aerial101/calibration.json)
+  --verbose                 print the binaries output too (always in output_dir/logs)
+  --rediscover              look the binaries up again rather than in the cache
+                            (~/.cache/aerial101/tools.json)
+
+Passthrough:
+  Option to be passed to command lines (remove - in front of option names)
+  e.g. --1 p ULTRA to use the ULTRA preset in openMVG_main_ComputeFeatures
+
+The binaries and the camera database are looked up only for the steps run, once:
+the folders found are kept in the user cache (tools.json) for the next runs.
+
+The output of every step goes to output_dir/logs (its end is printed when it fails);
+the percent done it reports is shown on one line with an ETA and kept in
+output_dir/progress.json.
+
+Every run adds the cost of its steps per megapixel of work (the pictures', reduced
+by --resolution-level and scaled by --number-views) to the calibration table;
+--plan reads the pictures count and JPEG size and scales those costs by the
+selected steps options and threads.
+"""
+
+import os
+import re
+import asyncio
+import codecs
+import threading
+import subprocess
+import shutil
+import sys
+import argparse
+import glob
+import time
+import json
+import csv
+import fnmatch
+import math
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+DEBUG = False
+
+if sys.platform.startswith('win'):
+    PATH_DELIM = ';'
+else:
+    PATH_DELIM = ':'
+
+CAMERA_SENSOR_DB_FILE = "sensor_width_camera_database.txt"
+
+# TOOLS: the file each folder is recognised by, and the question asked when it is not found
+TOOL_FOLDERS = {"openMVG": ("openMVG_main_SfMInit_ImageListing", "openMVG binary folder?\n"),
+                "openMVS": ("ReconstructMesh", "openMVS binary folder?\n"),
+                "sensor_db": (CAMERA_SENSOR_DB_FILE,
+                              "openMVG camera database (%s) folder?\n" % CAMERA_SENSOR_DB_FILE)}
+# folders found by this process
+TOOLS = {}
+
+
+def search_path():
+    """PATH, this script's directory and the current directory"""
+    return PATH_DELIM.join([os.environ.get('PATH', ''), os.path.dirname(os.path.abspath(__file__)), os.getcwd()])
+
+
+def whereis(afile):
+    """
+        return directory in which afile is, None if not found. Look in PATH
+    """
+    found = shutil.which(afile, path=search_path())
+    return os.path.dirname(found) if found else None
+
+
+def find(afile):
+    """
+        As whereis look only for executable on linux, this find look for all file type
+    """
+    for d in search_path().split(PATH_DELIM):
+        if os.path.isfile(os.path.join(d, afile)):
+            return d
+    return None
+
+
+def user_cache_dir():
+    """The aerial101 folder of the user cache directory"""
+    if sys.platform.startswith('win'):
+        base = os.environ.get('LOCALAPPDATA', os.path.expanduser('~'))
+    else:
+        base = os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(base, 'aerial101')
+
+
+def tools_cache_file():
+    """The JSON file of the folders found, in the user cache directory"""
+    return os.path.join(user_cache_dir(), 'tools.json')
+
+
+def holds(kind, folder):
+    """True when folder still holds the file of this kind"""
+    afile = TOOL_FOLDERS[kind][0]
+    if not folder:
+        return False
+    if kind == "sensor_db":
+        return os.path.isfile(os.path.join(folder, afile))
+    return shutil.which(afile, path=folder) is not None
+
+
+def tool_dir(kind, prompt=True, rediscover=False):
+    """
+        Folder of the openMVG or openMVS binaries or of the camera database ("sensor_db"),
+        looked up on first use only: in the user cache file, else in PATH, else asked for.
+        Returns None when not found and prompt is False.
+    """
+    if kind in TOOLS and not rediscover:
+        return TOOLS[kind]
+    cache = tools_cache_file()
+    try:
+        with open(cache) as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        cached = {}
+    folder = None if rediscover else cached.get(kind)
+    if not holds(kind, folder):
+        afile, question = TOOL_FOLDERS[kind]
+        folder = find(afile) if kind == "sensor_db" else whereis(afile)
+        if not folder and prompt:
+            # e.g. a batch worker: no one to answer
+            if not sys.stdin or not sys.stdin.isatty():
+                sys.exit("%s not found in PATH, add its folder to PATH or %s" % (afile, cache))
+            folder = input(question).strip()
+        if not folder:
+            return None
+        cached[kind] = os.path.abspath(folder)
+        try:
+            os.makedirs(os.path.dirname(cache), exist_ok=True)
+            with open(cache, 'w') as f:
+                json.dump(cached, f, indent=1)
+        except OSError:
+            pass    # a read-only home only costs the lookup next time
+    TOOLS[kind] = os.path.abspath(folder)
+    return TOOLS[kind]
+
+
+def tool_path(cmd, prompt=True):
+    """Full path of an openMVG/openMVS binary, the bare name if its folder is unknown and prompt is False"""
+    folder = tool_dir("openMVS" if cmd in OPENMVS_TOOLS else "openMVG", prompt)
+    return os.path.join(folder, cmd) if folder else cmd
+
+
+PRESET = {'SEQUENTIAL': [0, 1, 2, 3, 9, 10, 11, 12, 13],
+          'GLOBAL': [0, 1, 2, 4, 9, 10, 11, 12, 13],
+          'MVG_SEQ': [0, 1, 2, 3, 5, 6, 7],
+          'MVG_GLOBAL': [0, 1, 2, 4, 5, 6, 7],
+          'MVS_SGM': [14, 15, 21],
+          'AERIAL_SGM': [0, 1, 2, 3, 9, 14, 15, 21],
+          'AERIAL_SEQ': [0, 1, 2, 3, 9, 10],
+          'SEQ_geo': [0, 1, 2, 3, 4, 6, 9, 11, 12], # 13, 14, 15],
+          'SEQ_geoMesh': [18, 19, 20]
+          }
+
+PRESET_DEFAULT = 'SEQ_geo'
+
+# densifies, one DensifyPointCloud per sub-scene, what the split step (14) wrote
+DENSIFY_SUBSCENES = 15
+
+# per-step record of the commandline, inputs, outputs and exit status, kept in output_dir
+MANIFEST_FILE = "pipeline_manifest.json"
+
+# the live state of a run, for monitoring it without its terminal; the steps output goes to logs/
+PROGRESS_FILE = "progress.json"
+LOG_DIR = "logs"
+# seconds between two progress lines when the output is not a terminal
+PROGRESS_INTERVAL = 30
+
+# pictures counted by --plan; the size is read from the JPEG ones
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.tif', '.tiff', '.png')
+# openMVS --number-views when the commandline does not set it
+NUMBER_VIEWS = 5
+# runs kept per step in the calibration table, the most recent ones
+CALIBRATION_SAMPLES = 10
+
+# HELPERS for terminal colors
+BLACK, RED, GREEN, YELLOW, BLUE, MAGENTA, CYAN, WHITE = range(8)
+NO_EFFECT, BOLD, UNDERLINE, BLINK, INVERSE, HIDDEN = (0, 1, 4, 5, 7, 8)
+
+
+# from Python cookbook, #475186
+def has_colours(stream):
+    '''
+        Return stream colours capability
+    '''
+    if not hasattr(stream, "isatty"):
+        return False
+    if not stream.isatty():
+        return False  # auto color only on TTYs
+    try:
+        import curses
+        curses.setupterm()
+        return curses.tigetnum("colors") > 2
+    except Exception:
+        # guess false in case of error
+        return False
+
+# checked on the first printout
+HAS_COLOURS = None
+
+
+def printout(text, colour=WHITE, background=BLACK, effect=NO_EFFECT):
+    """
+        print() with colour
+    """
+    global HAS_COLOURS
+    if HAS_COLOURS is None:
+        HAS_COLOURS = has_colours(sys.stdout)
+    if HAS_COLOURS:
+        seq = "\x1b[%d;%d;%dm" % (effect, 30+colour, 40+background) + text + "\x1b[0m"
+        sys.stdout.write(seq+'\r\n')
+    else:
+        sys.stdout.write(text+'\r\n')
+
+
+# RESOURCES
+
+# per machine class, up to its memory (GB): memory each thread of the dense openMVS steps
+# may take, their --resolution-level and the ComputeMatches regions cache (-c); None keeps
+# the step's own value
+PROFILES = {'laptop': {"max-memory": 16, "mem-per-thread": 2.0, "resolution-level": "2", "cache": "50"},
+            'workstation': {"max-memory": 64, "mem-per-thread": 1.5, "resolution-level": None, "cache": None},
+            'node': {"max-memory": None, "mem-per-thread": 1.0, "resolution-level": None, "cache": None}}
+
+OPENMVS_TOOLS = ["DensifyPointCloud", "ReconstructMesh", "RefineMesh", "TextureMesh"]
+
+
+def read_int(fname):
+    """First word of a (cgroup) file as an int, None if absent or 'max'"""
+    try:
+        with open(fname) as f:
+            return int(f.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def available_cpus():
+    """CPUs this process may use: its affinity mask, capped by a cgroup (v2 or v1) CPU quota"""
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:    # cgroup v2: "<quota or max> <period>"
+            quota, period = f.read().split()
+        quota, period = (None if quota == 'max' else int(quota)), int(period)
+    except (OSError, ValueError):
+        quota = read_int('/sys/fs/cgroup/cpu/cpu.cfs_quota_us')    # cgroup v1: -1 when unlimited
+        period = read_int('/sys/fs/cgroup/cpu/cpu.cfs_period_us')
+    if quota and quota > 0 and period:
+        cpus = min(cpus, max(1, math.ceil(quota / period)))
+    return cpus
+
+
+def available_memory():
+    """Memory (GB) this process may use: physical memory capped by a cgroup limit, None if unknown"""
+    mem = None
+    if sys.platform.startswith('win'):
+        import ctypes
+
+        class MEMORYSTATUSEX(ctypes.Structure):
+            _fields_ = [("dwLength", ctypes.c_ulong), ("dwMemoryLoad", ctypes.c_ulong),
+                        ("ullTotalPhys", ctypes.c_ulonglong), ("ullAvailPhys", ctypes.c_ulonglong),
+                        ("ullTotalPageFile", ctypes.c_ulonglong), ("ullAvailPageFile", ctypes.c_ulonglong),
+                        ("ullTotalVirtual", ctypes.c_ulonglong), ("ullAvailVirtual", ctypes.c_ulonglong),
+                        ("ullAvailExtendedVirtual", ctypes.c_ulonglong)]
+        status = MEMORYSTATUSEX()
+        status.dwLength = ctypes.sizeof(MEMORYSTATUSEX)
+        if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+            mem = status.ullTotalPhys
+    else:
+        try:
+            mem = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+        except (ValueError, OSError, AttributeError):
+            pass
+    for limit in (read_int('/sys/fs/cgroup/memory.max'),
+                  read_int('/sys/fs/cgroup/memory/memory.limit_in_bytes')):
+        if limit and (mem is None or limit < mem):
+            mem = limit
+    return mem / 2**30 if mem else None
+
+
+def pick_profile(memory):
+    """The smallest machine class the memory (GB) fits in"""
+    for name, profile in PROFILES.items():
+        if memory is None or profile["max-memory"] is None or memory <= profile["max-memory"]:
+            return name
+
+
+def set_option(opt, name, value):
+    """Set option name to value in an options list, appending it when absent"""
+    if name in opt:
+        opt[opt.index(name) + 1] = value
+    else:
+        opt.extend([name, value])
+
+
+def plan_resources(steps, profile, cpus, memory):
+    """
+        Write the profile into the steps default options: thread counts from the
+        CPUs and the memory (GB) a thread may take, --resolution-level and the
+        matching cache. The --N passthrough options still override them.
+        Return the threads given to each step.
+    """
+    threads = cpus
+    if memory:
+        threads = max(1, min(cpus, int(memory // profile["mem-per-thread"])))
+    for i, s in enumerate(steps.steps_data):
+        tool, opt = os.path.basename(s[1]), s[2]
+        if tool in OPENMVS_TOOLS and i != DENSIFY_SUBSCENES:    # the sub-scene pool shares its own
+            set_option(opt, "--max-threads", str(threads))
+        elif tool == "openMVG_main_ComputeFeatures":
+            set_option(opt, "-n", str(threads))
+        if profile["resolution-level"] and "--resolution-level" in opt:
+            set_option(opt, "--resolution-level", profile["resolution-level"])
+        if profile["cache"] and tool == "openMVG_main_ComputeMatches":
+            set_option(opt, "-c", profile["cache"])
+    return threads
+
+
+# OBJECTS to store config and data in
+class ConfContainer:
+    """
+        Container for all the config variables
+    """
+    def __init__(self):
+        pass
+
+
+class AStep:
+    """
+        Represents a process step to be run, with the files it reads and
+        writes (wildcards allowed) and the CPUs it keeps busy, None for all
+    """
+    def __init__(self, info, cmd, opt, inputs, outputs, cpus):
+        self.info = info
+        self.cmd = cmd
+        self.opt = opt
+        self.inputs = inputs
+        self.outputs = outputs
+        self.cpus = cpus
+
+
+class StepsStore:
+    """ List of steps with facilities to configure them """
+    def __init__(self):
+        self.steps_data = [
+            ["Intrinsics analysis",          # 0
+             "openMVG_main_SfMInit_ImageListing",
+             ["-i", "%input_dir%", "-o", "%matches_dir%", "-P", "-m", "1", "-d", "%camera_file_params%"],
+             ["%input_dir%"],
+             ["%matches_dir%/sfm_data.json"], 1],
+            ["Compute features",             # 1
+             "openMVG_main_ComputeFeatures",
+             ["-i", "%matches_dir%/sfm_data.json", "-o", "%matches_dir%", "-f", "1", "-m", "SIFT", "-n", "4"], #  -f 1 will redo while 0 will use the previous
+             ["%matches_dir%/sfm_data.json"],
+             ["%matches_dir%/image_describer.json"], None],
+            ["Matching Pair List",           # 2
+             "openMVG_main_ListMatchingPairs",
+             ["-G", "-n", "5", "-i", "%matches_dir%/sfm_data.json", "-o", "%matches_dir%/pair_list.txt"],
+             ["%matches_dir%/sfm_data.json"],
+             ["%matches_dir%/pair_list.txt"], 1],
+            ["Compute matches",              # 3
+             "openMVG_main_ComputeMatches",
+             #["-i", "%matches_dir%/sfm_data.json", "-o", "%matches_dir%", "-n", "HNSWL2", "-r", ".8"]],
+             #-- changed to 'Approximate Nearest Neighbor L2 matching for Scalar based regions descriptor' and added pair list
+             #["-i", "%matches_dir%/sfm_data.json", "-o", "%matches_dir%", "-n", "ANNL2", "-r", ".8"]],
+             ["-i", "%matches_dir%/sfm_data.json", "-l", "%matches_dir%/pair_list.txt", "-o", "%matches_dir%", "-f", "1", "-r", "0.8", "-c", "100"], #"-n", "ANNL2",
+             ["%matches_dir%/sfm_data.json", "%matches_dir%/pair_list.txt", "%matches_dir%/image_describer.json"],
+             ["%matches_dir%/matches.f.bin"], None],
+            
+            ["Incremental reconstruction",   # 4
+             "openMVG_main_IncrementalSfM",
+             ["-i", "%matches_dir%/sfm_data.json", "-m", "%matches_dir%", "-o", "%reconstruction_dir%"],
+             ["%matches_dir%/sfm_data.json", "%matches_dir%/image_describer.json", "%matches_dir%/matches.f.bin"],
+             ["%reconstruction_dir%/sfm_data.bin"], None],
+            ["Global reconstruction",        # 5
+             "openMVG_main_GlobalSfM",
+             ["-i", "%matches_dir%/sfm_data.json", "-m", "%matches_dir%", "-o", "%reconstruction_dir%"],
+             ["%matches_dir%/sfm_data.json", "%matches_dir%/image_describer.json", "%matches_dir%/matches.f.bin"],
+             ["%reconstruction_dir%/sfm_data.bin"], None],
+            
+            ["Colorize Structure",           # 6
+             "openMVG_main_ComputeSfM_DataColor",
+             ["-i", "%reconstruction_dir%/sfm_data.bin", "-o", "%reconstruction_dir%/colorized.ply"],
+             ["%reconstruction_dir%/sfm_data.bin"],
+             ["%reconstruction_dir%/colorized.ply"], 1],
+            ["Structure from Known Poses",   # 7
+             "openMVG_main_ComputeStructureFromKnownPoses",
+             ["-i", "%reconstruction_dir%/sfm_data.bin", "-m", "%matches_dir%", "-f", "%matches_dir%/matches.f.bin", "-o", "%reconstruction_dir%/robust.bin"],
+             ["%reconstruction_dir%/sfm_data.bin", "%matches_dir%/image_describer.json", "%matches_dir%/matches.f.bin"],
+             ["%reconstruction_dir%/robust.bin"], None],
+            ["Colorized robust triangulation",  # 8
+             "openMVG_main_ComputeSfM_DataColor",
+             ["-i", "%reconstruction_dir%/robust.bin", "-o", "%reconstruction_dir%/robust_colorized.ply"],
+             ["%reconstruction_dir%/robust.bin"],
+             ["%reconstruction_dir%/robust_colorized.ply"], 1],
+            
+            ["Aerial GPS Registration",      # 9
+             "openMVG_main_geodesy_registration_to_gps_position",
+             ["-i", "%reconstruction_dir%/sfm_data.bin", "-o", "%reconstruction_dir%/sfm_dataGeo.bin"],
+             ["%reconstruction_dir%/sfm_data.bin"],
+             ["%reconstruction_dir%/sfm_dataGeo.bin"], 1],
+            ["Control Points Registration",  # 10
+             "ui_openMVG_control_points_registration",
+             ["-i", "%reconstruction_dir%/sfm_data.bin"],
+             ["%reconstruction_dir%/sfm_data.bin"],
+             [], 1],
+            
+            ["Export to openMVS",            # 11
+             "openMVG_main_openMVG2openMVS",
+             #["-i", "%reconstruction_dir%/sfm_data.bin", "-o", "%mvs_dir%/scene.mvs", "-d", "%mvs_dir%/images"]],
+             #-- with GPS prior (photo centres) change file name	
+             ["-i", "%reconstruction_dir%/sfm_dataGeo.bin", "-o", "%mvs_dir%/sceneGeo.mvs", "-d", "%mvs_dir%/images"],
+             ["%reconstruction_dir%/sfm_dataGeo.bin"],
+             ["%mvs_dir%/sceneGeo.mvs", "%mvs_dir%/images"], 1],
+            
+            ["Densify point cloud",          # 12
+             "DensifyPointCloud",
+             #["scene.mvs", "--dense-config-file", "Densify.ini", "--resolution-level", "1", "-w", "%mvs_dir%"]],
+             ["-i", "sceneGeo.mvs", "-o", "sceneGeo_dense.mvs", "--dense-config-file", "Densify.ini", "--resolution-level", "2", "--number-views", "5", "--max-threads", "4", "-w", "%mvs_dir%"],
+             ["%mvs_dir%/sceneGeo.mvs"],
+             ["%mvs_dir%/sceneGeo_dense.mvs"], None],
+
+            ["Densify point cloud",          # 13
+             "DensifyPointCloud",
+             ["-i", "sceneGeo.mvs", "--resolution-level", "1", "--fusion-mode", "1",  "--number-views", "5", "-w", "%mvs_dir%"],
+             ["%mvs_dir%/sceneGeo.mvs"],
+             ["%mvs_dir%/sceneGeo_dense.mvs"], None],
+            ["Split scene",                  # 14
+             "DensifyPointCloud",
+             ["-i", "sceneGeo.mvs", "--sub-scene-area", "660000", "--max-threads", "4", "-w", "%mvs_dir%"],
+             ["%mvs_dir%/sceneGeo.mvs"],
+             ["%mvs_dir%/sceneGeo_????.mvs"], None],
+            ["Densify sub-scenes",           # 15
+             "DensifyPointCloud",
+             #-- run once per sub-scene with "-i sceneGeo_####.mvs" and a share of the threads; depth-maps only
+             ["--dense-config-file", "Densify.ini", "--resolution-level", "1", "--fusion-mode", "-1", "-w", "%mvs_dir%"],
+             ["%mvs_dir%/sceneGeo_????.mvs"],
+             ["%mvs_dir%/depth*.dmap"], None],
+            
+            ["Estimate disparity-maps",      # 16
+             "DensifyPointCloud",
+             ["-i", "sceneGeo.mvs", "-o", "sceneGeo_denseSGM.mvs", "--dense-config-file", "Densify.ini", "--resolution-level", "2", "--fusion-mode", "-1", "-w", "%sgm_dir%"],
+             ["%sgm_dir%/sceneGeo.mvs"],
+             ["%sgm_dir%/depth*.dmap"], None],
+            ["Fuse disparity-maps",          # 17
+             "DensifyPointCloud",
+             ["-i", "sceneGeo.mvs", "-o", "sceneGeo_denseSGM.mvs", "--dense-config-file", "Densify.ini", "--resolution-level", "2", "--fusion-mode", "-2", "-w", "%sgm_dir%"],
+             ["%sgm_dir%/sceneGeo.mvs", "%sgm_dir%/depth*.dmap"],
+             ["%sgm_dir%/sceneGeo_denseSGM.mvs"], None],
+            
+            ["Reconstruct the mesh",         # 18
+             "ReconstructMesh",
+             ["-i", "sceneGeo_dense.mvs", "-o", "sceneGeo_denseMesh.mvs", "-w", "%mvs_dir%", "--max-threads", "4"],
+             ["%mvs_dir%/sceneGeo_dense.mvs"],
+             ["%mvs_dir%/sceneGeo_denseMesh.mvs"], None],
+            ["Refine the mesh",              # 19
+             "RefineMesh",
+             #["i", "scene_denseMesh.mvs", "--scales", "2", "-w", "%mvs_dir%"]],
+             #-- taking very long. change --scales to --resolution-level
+             ["-i", "sceneGeo_denseMesh.mvs", "-o", "sceneGeo_denseMesh_refine.mvs", "--resolution-level", "2", "-w", "%mvs_dir%", "--max-threads", "4"],
+             ["%mvs_dir%/sceneGeo_denseMesh.mvs"],
+             ["%mvs_dir%/sceneGeo_denseMesh_refine.mvs"], None],
+            ["Texture the mesh",             # 20
+             "TextureMesh",
+             ["sceneGeo_denseMesh_refine.mvs", "--resolution-level", "2", "--orthographic-image-resolution", "1000", "--max-threads", "4", "-w", "%mvs_dir%"],
+             ["%mvs_dir%/sceneGeo_denseMesh_refine.mvs"],
+             ["%mvs_dir%/sceneGeo_denseMesh_refine_texture.mvs"], None],
+            ["Merge scene",                  # 21
+             "DensifyPointCloud",
+             #-- fuse the depth-maps of every sub-scene into the one dense cloud
+             ["-i", "sceneGeo.mvs", "-o", "sceneGeo_dense.mvs", "--dense-config-file", "Densify.ini", "--resolution-level", "1", "--number-views-fuse", "2", "--fusion-mode", "-2", "-w", "%mvs_dir%"],
+             ["%mvs_dir%/sceneGeo.mvs", "%mvs_dir%/depth*.dmap"],
+             ["%mvs_dir%/sceneGeo_dense.mvs"], None],
+            ]
+
+    def __getitem__(self, indice):
+        return AStep(*self.steps_data[indice])
+
+    def configure(self, fname):
+        """ replace the options of the steps a dataset's pipeline.json lists:
+            {"options": {"<step>": [options]}} """
+        with open(fname) as f:
+            config = json.load(f)
+        for n, opt in config.get("options", {}).items():
+            self.steps_data[int(n)][2] = list(opt)
+
+    def length(self):
+        return len(self.steps_data)
+
+    def apply_conf(self, conf):
+        """ replace each %var% per conf.var value in steps data """
+        for s in self.steps_data:
+            for field in (2, 3, 4):    # options, inputs, outputs
+                o2 = []
+                for o in s[field]:
+                    co = o.replace("%input_dir%", conf.input_dir)
+                    co = co.replace("%output_dir%", conf.output_dir)
+                    co = co.replace("%matches_dir%", conf.matches_dir)
+                    co = co.replace("%reconstruction_dir%", conf.reconstruction_dir)
+                    co = co.replace("%mvs_dir%", conf.mvs_dir)
+                    co = co.replace("%sgm_dir%", conf.sgm_dir)
+                    co = co.replace("%camera_file_params%", conf.camera_file_params)
+                    o2.append(co)
+                s[field] = o2
+
+
+CONF = ConfContainer()
+STEPS = None
+# files (and folders) the runner itself writes in output_dir, never a step output
+BOOKKEEPING = []
+
+# ARGS
+
+def build_parser(steps):
+    """ the commandline parser, listing the steps and their passthrough options """
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawTextHelpFormatter,
+        description="Photogrammetry reconstruction with these steps: \r\n" +
+        "\r\n".join(("\t%i. %s\t %s" % (t, steps[t].info, steps[t].cmd) for t in range(steps.length())))
+        )
+    parser.add_argument('input_dir',
+                        help="the directory which contains the pictures set.")
+    parser.add_argument('output_dir',
+                        help="the directory which will contain the resulting files.")
+    parser.add_argument('--steps',
+                        type=int,
+                        nargs="+",
+                        help="steps to process")
+    parser.add_argument('--preset',
+                        help="steps list preset in \r\n" +
+                        " \r\n".join([k + " = " + str(PRESET[k]) for k in PRESET]) +
+                        " \r\ndefault : " + PRESET_DEFAULT)
+    parser.add_argument('--cpu-budget',
+                        type=int,
+                        default=available_cpus(),
+                        help="CPUs shared by the steps run at the same time (default: all). \r\n" +
+                        "Steps that share no input or output file run concurrently; \r\n" +
+                        "a step counts its --max-threads, else all CPUs for the multi-threaded ones")
+    parser.add_argument('--subscene-workers',
+                        type=int,
+                        metavar='N',
+                        help="DensifyPointCloud processes run at the same time on the sub-scenes \r\n" +
+                        "of step %i, sharing the CPU budget (default: half the budget)" % DENSIFY_SUBSCENES)
+    parser.add_argument('--profile',
+                        default='auto',
+                        choices=['auto', 'none'] + list(PROFILES),
+                        help="threads, --resolution-level and ComputeMatches cache (-c) per machine class \r\n" +
+                        "(default: auto, from the memory available; none: keep the steps options)")
+    parser.add_argument('--force',
+                        action='store_true',
+                        help="rerun the steps already completed in output_dir \r\n" +
+                        "(by default a step is skipped when " + MANIFEST_FILE + " shows it succeeded\r\n" +
+                        "with the same commandline and inputs and its outputs still exist)")
+    parser.add_argument('--dry-run',
+                        action='store_true',
+                        help="print the steps commandlines and their order, run nothing")
+    parser.add_argument('--plan',
+                        action='store_true',
+                        help="print the estimated wall time, peak memory and disk written per step, \r\n" +
+                        "from the calibration table of the earlier runs; run nothing")
+    parser.add_argument('--calibration',
+                        metavar='FILE',
+                        default=calibration_file(),
+                        help="calibration table the runs add to and --plan reads \r\n(default: %(default)s)")
+    parser.add_argument('--verbose',
+                        action='store_true',
+                        help="print the binaries output too; it is always in output_dir/" + LOG_DIR)
+    parser.add_argument('--rediscover',
+                        action='store_true',
+                        help="look the openMVG/openMVS binaries up again rather than in the cache \r\n" +
+                        "(" + tools_cache_file() + ")")
+
+    group = parser.add_argument_group('Passthrough', description="Option to be passed to command lines (remove - in front of option names)\r\ne.g. --1 p ULTRA to use the ULTRA preset in openMVG_main_ComputeFeatures")
+    for n in range(steps.length()):
+        group.add_argument('--'+str(n), nargs='+')
+    return parser
+
+
+# FOLDERS
+
+def mkdir_ine(dirname):
+    """Create the folder if not presents"""
+    if not os.path.exists(dirname):
+        os.mkdir(dirname)
+
+
+# REPORT
+
+def dir_size(dirname):
+    """Total size in bytes of the files under dirname, 0 if absent"""
+    total = 0
+    for root, _, files in os.walk(dirname):
+        for f in files:
+            try:
+                total += os.path.getsize(os.path.join(root, f))
+            except OSError:
+                pass
+    return total
+
+
+def run_step(cmdline, key=None, label=None, log_file=None):
+    """
+        Launch cmdline and wait for it, its output streamed to log_file and its
+        progress to PROGRESS under key. Return its exit code with the
+        wall time, CPU user/system time (s) and peak RSS (MB) of the child.
+        Peak RSS is read from os.wait4 where available, else from the
+        RUSAGE_CHILDREN counters (the largest child so far); neither exist
+        on Windows, where only wall time is recorded.
+    """
+    try:
+        import resource
+    except ImportError:
+        resource = None
+    # ru_maxrss is in kilobytes on linux, bytes on macOS
+    rss_scale = 1 if sys.platform == 'darwin' else 1024
+    before = resource.getrusage(resource.RUSAGE_CHILDREN) if resource else None
+    key = key or os.path.basename(cmdline[0])
+    log_file = log_file or os.devnull
+
+    start = time.perf_counter()
+    PROGRESS.start(key, label or key, log_file)
+    try:
+        returncode, usage = asyncio.run(stream_step(cmdline, log_file, key))
+    finally:
+        PROGRESS.finish(key)
+    wall = time.perf_counter() - start
+    if returncode != 0:
+        print_tail(log_file, "#\t%s exited with %i, the end of %s:" % (label or key, returncode, log_file))
+
+    record = {"returncode": returncode, "wall_s": round(wall, 3),
+              "user_s": None, "sys_s": None, "max_rss_mb": None}
+    if usage is None and resource:
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        user, system = usage.ru_utime - before.ru_utime, usage.ru_stime - before.ru_stime
+    elif usage is not None:
+        user, system = usage.ru_utime, usage.ru_stime
+    if usage is not None:
+        record.update(user_s=round(user, 3), sys_s=round(system, 3),
+                      max_rss_mb=round(usage.ru_maxrss * rss_scale / 2**20, 1))
+    return record
+
+
+async def pump(reader, log, key):
+    """Copy a child's stream to its log (and stdout with --verbose) as it comes, and parse its progress"""
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    parser = ProgressParser()
+    while True:
+        data = await reader.read(65536)
+        if not data:
+            return
+        log.write(data)
+        log.flush()
+        if getattr(CONF, "verbose", False):
+            sys.stdout.buffer.write(data)
+            sys.stdout.flush()
+        parser.feed(decoder.decode(data))
+        PROGRESS.update(key, parser.percent)
+
+
+async def stream_step(cmdline, log_file, key):
+    """
+        Run cmdline with its stdout and stderr read as they come. Return its exit
+        code and resource usage, the latter from os.wait4 where available: the
+        pipes are then read by the event loop from a Popen so that asyncio does
+        not reap the child first.
+    """
+    loop = asyncio.get_running_loop()
+    with open(log_file, 'wb') as log:
+        if hasattr(os, 'wait4'):
+            proc = subprocess.Popen(cmdline, stdin=subprocess.DEVNULL,
+                                    stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            readers = []
+            for pipe in (proc.stdout, proc.stderr):
+                reader = asyncio.StreamReader()
+                await loop.connect_read_pipe(lambda r=reader: asyncio.StreamReaderProtocol(r), pipe)
+                readers.append(reader)
+        else:
+            proc = await asyncio.create_subprocess_exec(*cmdline, stdin=subprocess.DEVNULL,
+                                                        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            readers = [proc.stdout, proc.stderr]
+        await asyncio.gather(*(pump(r, log, key) for r in readers))
+    if hasattr(os, 'wait4'):
+        _, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        return proc.returncode, usage
+    return await proc.wait(), None
+
+
+def print_tail(log_file, title, lines=20):
+    """Print the last lines of a step log, e.g. after it failed"""
+    try:
+        with open(log_file, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - 16384))
+            tail = f.read().decode(errors='replace')
+    except OSError:
+        return
+    printout(title, colour=RED)
+    for line in re.split(r'[\r\n]+', tail.strip())[-lines:]:
+        print('\t' + line)
+
+
+def write_report(report, output_dir):
+    """Write the per-step records to run_report.json and run_report.csv in output_dir"""
+    with open(os.path.join(output_dir, "run_report.json"), 'w') as f:
+        json.dump(report, f, indent=2)
+    if report["steps"]:
+        with open(os.path.join(output_dir, "run_report.csv"), 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(report["steps"][0]))
+            writer.writeheader()
+            writer.writerows(report["steps"])
+
+
+# MANIFEST
+
+def fingerprint(path):
+    """Size and modification time of a file; cheaper than hashing multi-GB scenes"""
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def snapshot(dirname):
+    """Fingerprint of every file under dirname, keyed by path"""
+    snap = {}
+    for root, _, files in os.walk(dirname):
+        for f in files:
+            try:
+                snap[os.path.join(root, f)] = fingerprint(os.path.join(root, f))
+            except OSError:
+                pass
+    return snap
+
+
+def step_inputs(cmdline, input_dir):
+    """
+        Fingerprints of the existing files a commandline refers to (the binary
+        included), and of every picture when it is given the input_dir.
+        Relative names are looked up in the openMVS working folder (-w).
+    """
+    workdir = cmdline[cmdline.index('-w') + 1] if '-w' in cmdline else os.getcwd()
+    inputs = {}
+    for arg in cmdline:
+        path = os.path.join(workdir, arg)
+        if os.path.isfile(path):
+            inputs[path] = fingerprint(path)
+        elif os.path.abspath(path) == input_dir:
+            inputs.update(snapshot(input_dir))
+    return inputs
+
+
+def step_done(entry, cmdline, input_dir):
+    """True when a manifest entry shows cmdline already succeeded on the same inputs and its outputs are still there"""
+    return (entry is not None and entry["returncode"] == 0 and entry["cmdline"] == cmdline
+            and entry["inputs"] == step_inputs(cmdline, input_dir)
+            and all(os.path.exists(p) for p in entry["outputs"]))
+
+
+def load_manifest(output_dir):
+    """Per-step records of the earlier runs in output_dir, {} if none"""
+    try:
+        with open(os.path.join(output_dir, MANIFEST_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_manifest(manifest, output_dir):
+    with open(os.path.join(output_dir, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=1)
+
+
+# PROGRESS
+
+# "(12.34%, 1m 2s, ETA 8m 10s)" of openMVS, percents of openMVG's tools
+PERCENT = re.compile(r'(\d{1,3}(?:\.\d+)?)\s?%')
+# openMVG's C_Progress_display: 51 '*' below this ruler make 100%
+OPENMVG_RULER = "|----|----|"
+OPENMVG_STARS = 51
+
+
+class ProgressParser:
+    """
+        Percent done of a step from its output: the '*' of openMVG's progress bars,
+        the last percentage of the line otherwise. Lines may end with '\r'.
+    """
+
+    def __init__(self):
+        self.line = ""
+        self.bar = False
+        self.percent = None
+
+    def feed(self, text):
+        *lines, self.line = re.split(r'[\r\n]', self.line + text)
+        for line in lines:
+            self.parse(line)
+        if self.bar and self.line.startswith('*'):
+            self.percent = min(100.0, 100.0 * self.line.count('*') / OPENMVG_STARS)
+
+    def parse(self, line):
+        if line.startswith(OPENMVG_RULER):
+            self.bar, self.percent = True, 0.0
+        elif self.bar and line.startswith('*'):
+            self.bar, self.percent = False, 100.0
+        elif not line.startswith('0%'):    # the "0%   10   20 ... 100%" scale above the ruler
+            found = PERCENT.findall(line)
+            if found:
+                self.percent = min(100.0, float(found[-1]))
+
+
+class Progress:
+    """
+        The steps (and sub-scenes) running with their percent done and ETA, shown
+        on one line: rewritten in place on a terminal, every PROGRESS_INTERVAL s
+        otherwise. Each line is also written to the progress file, so that a run
+        can be followed without its terminal (e.g. the flights of batch_flights.py).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tasks = {}
+        self.fname, self.total, self.done = None, 0, 0
+        self.shown = 0.0
+
+    def configure(self, fname, total):
+        self.fname, self.total, self.done = fname, total, 0
+
+    def start(self, key, label, log_file):
+        with self.lock:
+            self.tasks[key] = {"label": label, "log": log_file, "percent": None, "started": time.time()}
+        self.show()
+
+    def update(self, key, percent):
+        with self.lock:
+            task = self.tasks.get(key)
+            if task is None or percent is None or task["percent"] == percent:
+                return
+            task["percent"] = percent
+        self.show()
+
+    def finish(self, key):
+        with self.lock:
+            self.tasks.pop(key, None)
+
+    def advance(self):
+        """One more step of the run done (or skipped)"""
+        with self.lock:
+            self.done += 1
+        self.show(force=True)
+
+    def status(self):
+        """The progress file content: steps done, and per task running its elapsed time and ETA"""
+        now = time.time()
+        running = []
+        with self.lock:
+            for key, t in self.tasks.items():
+                elapsed, p = now - t["started"], t["percent"]
+                eta = elapsed * (100 - p) / p if p else None
+                running.append({"task": key, "label": t["label"], "percent": p, "elapsed_s": round(elapsed),
+                                "eta_s": eta and round(eta), "log": t["log"]})
+            done, total = self.done, self.total
+        etas = [r["eta_s"] for r in running if r["eta_s"] is not None]
+        return {"updated": time.strftime("%Y-%m-%dT%H:%M:%S"), "steps_done": done, "steps_total": total,
+                "running": running, "eta_s": max(etas) if etas else None}
+
+    def show(self, force=False):
+        tty = sys.stdout.isatty()
+        now = time.time()
+        if not force and now - self.shown < (1 if tty else PROGRESS_INTERVAL):
+            return
+        self.shown = now
+        status = self.status()
+        line = progress_line(status)
+        if tty:
+            width = shutil.get_terminal_size().columns - 1
+            sys.stdout.write('\r' + line[:width] + '\x1b[K\r')
+        else:
+            sys.stdout.write(line + '\n')
+        sys.stdout.flush()
+        if self.fname:
+            try:
+                with open(self.fname, 'w') as f:
+                    json.dump(status, f, indent=1)
+            except OSError:
+                pass
+
+
+def progress_line(status):
+    """'# 3/9 steps | #3. Compute matches 45% | ETA 0:02:10' from a Progress.status()"""
+    parts = ["# %i/%i steps" % (status["steps_done"], status["steps_total"])]
+    for r in status["running"]:
+        parts.append("%s %s" % (r["label"], "%.0f%%" % r["percent"] if r["percent"] is not None
+                                else timedelta(seconds=r["elapsed_s"])))
+    if status["eta_s"] is not None:
+        parts.append("ETA %s" % timedelta(seconds=status["eta_s"]))
+    return " | ".join(parts)
+
+
+PROGRESS = Progress()
+
+
+# PLAN
+
+def jpeg_size(fname):
+    """(width, height) from the frame header (SOFn marker) of a JPEG file, None if not a JPEG"""
+    with open(fname, 'rb') as f:
+        if f.read(2) != b'\xff\xd8':
+            return None
+        while True:
+            marker = f.read(2)
+            if len(marker) < 2 or marker[0] != 0xFF:
+                return None
+            length = int.from_bytes(f.read(2), 'big')
+            if 0xC0 <= marker[1] <= 0xCF and marker[1] not in (0xC4, 0xC8, 0xCC):    # not DHT, JPG, DAC
+                frame = f.read(5)    # precision, height, width
+                return int.from_bytes(frame[3:5], 'big'), int.from_bytes(frame[1:3], 'big')
+            f.seek(length - 2, 1)    # EXIF and the other segments, unread
+
+
+def image_stats(input_dir):
+    """Number of pictures in input_dir and their median size in megapixels, None if no JPEG"""
+    images = [os.path.join(input_dir, f) for f in sorted(os.listdir(input_dir))
+              if f.lower().endswith(IMAGE_EXTENSIONS)]
+    sizes = []
+    for image in images:
+        try:
+            size = jpeg_size(image)
+        except OSError:
+            continue
+        if size:
+            sizes.append(size[0] * size[1] / 1e6)
+    sizes.sort()
+    return len(images), sizes[len(sizes) // 2] if sizes else None
+
+
+def option(cmdline, name, default=None):
+    """Value following name in a commandline, default if absent"""
+    return cmdline[cmdline.index(name) + 1] if name in cmdline else default
+
+
+def step_threads(step, cmdline, budget):
+    """Threads a step runs: the -n of openMVG_main_ComputeFeatures, else as step_cpus"""
+    if step.cmd == "openMVG_main_ComputeFeatures" and "-n" in cmdline:
+        return max(1, int(option(cmdline, "-n")))
+    return step_cpus(step, cmdline, budget)
+
+
+def work_units(step, cmdline, images, megapixels):
+    """
+        The size of a step's work in megapixels: the pictures', scaled down 4x per
+        --resolution-level and in proportion to --number-views for the openMVS tools.
+        None when the picture size is unknown.
+    """
+    if not megapixels:
+        return None
+    units = images * megapixels
+    if step.cmd in OPENMVS_TOOLS:
+        units /= 4 ** int(option(cmdline, "--resolution-level", 1))
+        units *= (int(option(cmdline, "--number-views", NUMBER_VIEWS)) or NUMBER_VIEWS) / NUMBER_VIEWS
+    return units
+
+
+def calibration_file():
+    """The calibration table of the runs on this machine, in the user cache directory"""
+    return os.path.join(user_cache_dir(), 'calibration.json')
+
+
+def load_calibration(fname):
+    """Per-step samples of the cost per work unit, {} if none"""
+    try:
+        with open(fname) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def calibrate(report, fname):
+    """
+        Add the cost per work unit of the report's successful steps to the calibration
+        table: CPU seconds (wall x threads where CPU time is not measured), peak memory
+        and written MB.
+    """
+    table = load_calibration(fname)
+    for r in report["steps"]:
+        if r["returncode"] != 0 or not r["units"]:
+            continue
+        cpu_s = r["user_s"] + r["sys_s"] if r["user_s"] is not None else r["wall_s"] * r["threads"]
+        sample = {"cpu_s": cpu_s / r["units"], "rss_mb": r["max_rss_mb"] and r["max_rss_mb"] / r["units"],
+                  "disk_mb": r["written_mb"] / r["units"]}
+        table[str(r["step"])] = (table.get(str(r["step"]), []) + [sample])[-CALIBRATION_SAMPLES:]
+    try:
+        os.makedirs(os.path.dirname(fname), exist_ok=True)
+        with open(fname, 'w') as f:
+            json.dump(table, f, indent=1)
+    except OSError:
+        pass
+
+
+def median(values):
+    values = sorted(v for v in values if v is not None)
+    return values[len(values) // 2] if values else None
+
+
+def print_plan(cmdlines, fname):
+    """
+        Estimated wall time, peak memory and disk written per step, from the calibration
+        table scaled to the pictures and the steps options; nothing is run
+    """
+    table = load_calibration(fname)
+    printout("# Plan: %i pictures of %s MP" % (CONF.images, "%.1f" % CONF.megapixels if CONF.megapixels else "?"),
+             effect=INVERSE)
+    print("#%3s %-28s %7s %10s %10s %10s" % ("", "step", "threads", "wall", "peak MB", "disk MB"))
+    total_s, peak, disk, missing = 0, 0, 0, []
+    for cstep in CONF.steps:
+        step, cmdline = STEPS[cstep], cmdlines[cstep]
+        threads = step_threads(step, cmdline, CONF.cpu_budget)
+        units = work_units(step, cmdline, CONF.images, CONF.megapixels)
+        samples = table.get(str(cstep))
+        if not samples or units is None:
+            missing.append(cstep)
+            print("#%2i. %-28s %7i %10s %10s %10s" % (cstep, step.info, threads, "-", "-", "-"))
+            continue
+        wall = median(s["cpu_s"] for s in samples) * units / threads
+        rss = median(s["rss_mb"] for s in samples)
+        mb = median(s["disk_mb"] for s in samples) * units
+        total_s, disk = total_s + wall, disk + mb
+        peak = max(peak, rss * units if rss is not None else 0)
+        print("#%2i. %-28s %7i %10s %10s %10.0f" % (cstep, step.info, threads, timedelta(seconds=round(wall)),
+                                                    "%.0f" % (rss * units) if rss is not None else "-", mb))
+    print("# total: %s one step at a time, %.0f MB peak, %.0f MB written" % (timedelta(seconds=round(total_s)), peak, disk))
+    if missing:
+        print("# steps %s not estimated: %s" % (missing, "no calibration yet, a run of them records it"
+                                               if CONF.megapixels else "picture size unknown (no JPEG)"))
+    print("# calibration: %s" % fname)
+
+
+# SCHEDULE
+
+def overlap(files_a, files_b):
+    """True if two lists of file names, wildcards allowed, share a file"""
+    norm = lambda f: f.replace('\\', '/')
+    return any(fnmatch.fnmatch(norm(a), norm(b)) or fnmatch.fnmatch(norm(b), norm(a))
+               for a in files_a for b in files_b)
+
+
+def depends(step, earlier):
+    """True if step must wait for an earlier one: it reads or rewrites what that one writes, or rewrites what it reads"""
+    return (overlap(step.inputs, earlier.outputs) or overlap(step.outputs, earlier.outputs)
+            or overlap(step.outputs, earlier.inputs))
+
+
+def step_cpus(step, cmdline, budget):
+    """CPUs a step is expected to keep busy: its --max-threads, else its declared count, else the whole budget"""
+    cpus = step.cpus
+    if "--max-threads" in cmdline:
+        cpus = int(cmdline[cmdline.index("--max-threads") + 1])    # 0 is every core
+    return max(1, min(cpus or budget, budget))
+
+
+def densify_subscenes(step, cmdline):
+    """
+        Run cmdline once per sub-scene matching the step inputs, with "-i" set,
+        in a pool of processes dividing the CPU budget between them. Return one
+        record for them all as run_step does, the first failure as its exit code.
+    """
+    subscenes = sorted(glob.glob(step.inputs[0].replace('\\', os.sep)))
+    if not subscenes:
+        printout("#\tno sub-scene %s, run the split step first" % step.inputs[0], colour=RED)
+        return {"returncode": 1, "wall_s": 0.0, "user_s": None, "sys_s": None, "max_rss_mb": None}
+    workers = min(len(subscenes), CONF.subscene_workers or max(1, CONF.cpu_budget // 2))
+    threads = str(max(1, CONF.cpu_budget // workers))
+    opt = cmdline[1:]
+    if "--max-threads" in opt:
+        idx = opt.index("--max-threads")
+        del opt[idx:idx+2]
+    cmdlines = [[cmdline[0], "-i", os.path.basename(sub)] + opt + ["--max-threads", threads] for sub in subscenes]
+    print('#\t%i sub-scenes, %i at a time with %s threads each' % (len(subscenes), workers, threads))
+
+    def run_subscene(sub, cmdline):
+        name = os.path.splitext(os.path.basename(sub))[0]
+        return run_step(cmdline, "%i:%s" % (DENSIFY_SUBSCENES, name), "#%i. %s" % (DENSIFY_SUBSCENES, name),
+                        step_log(DENSIFY_SUBSCENES, step, name))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        records = list(pool.map(run_subscene, subscenes, cmdlines))
+    known = lambda key: [r[key] for r in records if r[key] is not None]
+    return {"returncode": next((r["returncode"] for r in records if r["returncode"] != 0), 0),
+            "wall_s": round(time.perf_counter() - start, 3),
+            "user_s": round(sum(known("user_s")), 3) if known("user_s") else None,
+            "sys_s": round(sum(known("sys_s")), 3) if known("sys_s") else None,
+            "max_rss_mb": max(known("max_rss_mb")) if known("max_rss_mb") else None}
+
+
+def step_log(cstep, step, name=None):
+    """The log file of a step (of one of its sub-scenes with name) in output_dir/logs"""
+    return os.path.join(CONF.output_dir, LOG_DIR, "%02i_%s%s.log" % (cstep, step.cmd, "_" + name if name else ""))
+
+
+def bookkeeping(path):
+    """True for the files the runner itself writes in output_dir"""
+    return any(path == b or path.startswith(b + os.sep) for b in BOOKKEEPING)
+
+
+def launch(cstep, cmdline):
+    """Run one step (in a worker thread); return its report record and manifest entry"""
+    before = snapshot(CONF.output_dir)
+    if cstep == DENSIFY_SUBSCENES:
+        record = densify_subscenes(STEPS[cstep], cmdline)
+    else:
+        record = run_step(cmdline, str(cstep), "#%i. %s" % (cstep, STEPS[cstep].info), step_log(cstep, STEPS[cstep]))
+    after = snapshot(CONF.output_dir)
+    entry = {"cmdline": cmdline,
+             "inputs": step_inputs(cmdline, CONF.input_dir),
+             # steps running side by side each claim the files written meanwhile
+             "outputs": {p: f for p, f in after.items() if before.get(p) != f and not bookkeeping(p)},
+             "returncode": record["returncode"]}
+    record = dict({"step": cstep, "info": STEPS[cstep].info, "cmd": ' '.join(cmdline),
+                   "threads": step_threads(STEPS[cstep], cmdline, CONF.cpu_budget),
+                   "units": work_units(STEPS[cstep], cmdline, CONF.images, CONF.megapixels)}, **record)
+    record["written_mb"] = round(sum(f[0] for f in entry["outputs"].values()) / 2**20, 1)
+    record["matches_mb"] = round(dir_size(CONF.matches_dir) / 2**20, 1)
+    record["reconstruction_mb"] = round(dir_size(CONF.reconstruction_dir) / 2**20, 1)
+    record["mvs_mb"] = round(dir_size(CONF.mvs_dir) / 2**20, 1)
+    return record, entry
+
+
+def main(argv=None, config=None):
+    """
+        Run the steps argv (sys.argv by default) selects, with the options of
+        a dataset's pipeline.json config over the default ones
+    """
+    global STEPS
+    STEPS = StepsStore()
+    if config:
+        STEPS.configure(config)
+    build_parser(STEPS).parse_args(argv, namespace=CONF)  # store args in the ConfContainer
+
+    # Absolute path for input and ouput dirs
+    CONF.input_dir = os.path.abspath(CONF.input_dir)
+    CONF.output_dir = os.path.abspath(CONF.output_dir)
+
+    if not os.path.exists(CONF.input_dir):
+        sys.exit("%s: path not found" % CONF.input_dir)
+    CONF.images, CONF.megapixels = image_stats(CONF.input_dir)
+
+    CONF.reconstruction_dir = os.path.join(CONF.output_dir, "sfm")
+    CONF.matches_dir = os.path.join(CONF.reconstruction_dir, "matches")
+    CONF.mvs_dir = os.path.join(CONF.output_dir, "mvs")
+    CONF.sgm_dir = os.path.join(CONF.output_dir, "sgm")
+
+    if not (CONF.dry_run or CONF.plan):
+        mkdir_ine(CONF.output_dir)
+        mkdir_ine(CONF.reconstruction_dir)
+        mkdir_ine(CONF.matches_dir)
+        mkdir_ine(CONF.mvs_dir)
+        #mkdir_ine(CONF.sgm_dir)
+
+    # PRESET
+    if CONF.steps and CONF.preset:
+        sys.exit("Steps and preset arguments can't be set together.")
+    elif CONF.preset:
+        try:
+            CONF.steps = PRESET[CONF.preset]
+        except KeyError:
+            sys.exit("Unknown preset %s, choose %s" % (CONF.preset, ' or '.join([s for s in PRESET])))
+    elif not CONF.steps:
+        CONF.steps = PRESET[PRESET_DEFAULT]
+
+    # TOOLS: looked up for the selected steps only, a dry run never asks for them
+    prompt = not (CONF.dry_run or CONF.plan)
+    if CONF.rediscover:
+        for kind in {"openMVS" if STEPS[s].cmd in OPENMVS_TOOLS else "openMVG" for s in CONF.steps}:
+            tool_dir(kind, prompt, rediscover=True)
+    CONF.camera_file_params = CAMERA_SENSOR_DB_FILE
+    if 0 in CONF.steps:
+        db_dir = tool_dir("sensor_db", prompt, rediscover=CONF.rediscover)
+        if db_dir:
+            CONF.camera_file_params = os.path.join(db_dir, CAMERA_SENSOR_DB_FILE)
+
+    # Update directories in steps commandlines
+    STEPS.apply_conf(CONF)
+
+    # RESOURCES
+    CONF.memory = available_memory()
+    if CONF.profile != 'none':
+        if CONF.profile == 'auto':
+            CONF.profile = pick_profile(CONF.memory)
+        CONF.threads = plan_resources(STEPS, PROFILES[CONF.profile], CONF.cpu_budget, CONF.memory)
+        # openMVG steps thread through OpenMP, which ignores cgroup quotas
+        os.environ.setdefault('OMP_NUM_THREADS', str(CONF.cpu_budget))
+
+    # WALK
+    print("# Using input dir:  %s" % CONF.input_dir)
+    print("#   Output dir:  %s" % CONF.output_dir)
+    print("# Steps:  %s" % str(CONF.steps))
+    print("# Resources:  %i CPUs, %s GB" % (CONF.cpu_budget, "%.1f" % CONF.memory if CONF.memory else "?") +
+          (", %s profile, %i threads per step" % (CONF.profile, CONF.threads) if CONF.profile != 'none' else ""))
+
+    if 2 in CONF.steps:    # list pairs
+        if 5 in CONF.steps:  # GlobalReconstruction
+            # Set the geometric_model of ComputeMatches to Essential
+            STEPS[2].opt.extend(["-g", "e"])
+
+    report = {"input_dir": CONF.input_dir, "output_dir": CONF.output_dir,
+              "images": CONF.images, "megapixels": CONF.megapixels,
+              "started": time.strftime("%Y-%m-%dT%H:%M:%S"), "steps": []}
+    manifest = load_manifest(CONF.output_dir)
+    BOOKKEEPING[:] = [os.path.join(CONF.output_dir, f) for f in (MANIFEST_FILE, "run_report.json", "run_report.csv",
+                                                                 PROGRESS_FILE, LOG_DIR)]
+
+    # DAG: a step waits for the earlier steps of the list it shares a file with
+    depends_on = {cstep: [e for e in CONF.steps[:i] if depends(STEPS[cstep], STEPS[e])]
+               for i, cstep in enumerate(CONF.steps)}
+    cmdlines = {}
+
+    for cstep in CONF.steps:
+        # Retrieve "passthrough" commandline options
+        opt = getattr(CONF, str(cstep))
+        if opt:
+            # add - sign to short options and -- to long ones
+            for o in range(0, len(opt), 2):
+                if len(opt[o]) > 1:
+                    opt[o] = '-' + opt[o]
+                opt[o] = '-' + opt[o]
+        else:
+            opt = []
+
+        # Remove STEPS[cstep].opt options now defined in opt
+        for anOpt in STEPS[cstep].opt:
+            if anOpt in opt:
+                idx = STEPS[cstep].opt.index(anOpt)
+                if DEBUG:
+                    print('#\tRemove ' + str(anOpt) + ' from defaults options at id ' + str(idx))
+                del STEPS[cstep].opt[idx:idx+2]
+
+        # create a commandline for the current step
+        cmdlines[cstep] = [tool_path(STEPS[cstep].cmd, prompt)] + STEPS[cstep].opt + opt
+
+    if CONF.plan:
+        print_plan(cmdlines, CONF.calibration)
+        return
+
+    failed = False
+    if DEBUG or CONF.dry_run:
+        for cstep in CONF.steps:
+            printout("#%i. %s" % (cstep, STEPS[cstep].info), effect=INVERSE)
+            print('\t'.join(cmdlines[cstep]))
+            if depends_on[cstep]:
+                print('#\tafter steps %s' % depends_on[cstep])
+    else:
+        mkdir_ine(os.path.join(CONF.output_dir, LOG_DIR))
+        PROGRESS.configure(os.path.join(CONF.output_dir, PROGRESS_FILE), len(CONF.steps))
+        pending = list(CONF.steps)
+        running = {}    # future: (step, cpus)
+        done, ran = set(), set()
+        with ThreadPoolExecutor(max_workers=len(pending) or 1) as pool:
+            try:
+                while pending or running:
+                    free = CONF.cpu_budget - sum(c for _, c in running.values())
+                    for cstep in list(pending):
+                        if failed:
+                            break
+                        if not all(e in done for e in depends_on[cstep]):
+                            continue
+                        cmdline = cmdlines[cstep]
+                        # a step reruns once one it depends on has run: its inputs may be folders
+                        # (-m %matches_dir%) whose content is not fingerprinted
+                        if (not CONF.force and not any(e in ran for e in depends_on[cstep])
+                                and step_done(manifest.get(str(cstep)), cmdline, CONF.input_dir)):
+                            printout("#%i. %s -- up to date, skipped" % (cstep, STEPS[cstep].info), colour=GREEN)
+                            pending.remove(cstep)
+                            done.add(cstep)
+                            PROGRESS.advance()
+                            continue
+                        # what the step runs: ComputeFeatures' -n counts, as in plan_resources
+                        cpus = min(step_threads(STEPS[cstep], cmdline, CONF.cpu_budget), CONF.cpu_budget)
+                        if running and cpus > free:
+                            continue
+                        # Launch the current step
+                        printout("#%i. %s" % (cstep, STEPS[cstep].info), effect=INVERSE)
+                        print('Cmd: ' + ' '.join(cmdline))
+                        print('Log: ' + step_log(cstep, STEPS[cstep], '*' if cstep == DENSIFY_SUBSCENES else None))
+                        running[pool.submit(launch, cstep, cmdline)] = (cstep, cpus)
+                        pending.remove(cstep)
+                        free -= cpus
+                    if not running:
+                        break    # a step failed, the ones after it cannot start
+                    finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        cstep, _ = running.pop(future)
+                        record, manifest[str(cstep)] = future.result()
+                        write_manifest(manifest, CONF.output_dir)
+                        report["steps"].append(record)
+                        # rewritten after every step so a failed or cancelled run still has its report
+                        write_report(report, CONF.output_dir)
+                        print('#%i.\t%.1f s wall, %s s user, %s s sys, %s MB peak' % (
+                            cstep, record["wall_s"], record["user_s"], record["sys_s"], record["max_rss_mb"]))
+                        ran.add(cstep)
+                        PROGRESS.advance()
+                        if record["returncode"] == 0:
+                            done.add(cstep)
+                        else:
+                            failed = True
+            except KeyboardInterrupt:
+                sys.exit('\r\nProcess cancelled by user, all files remains')
+
+    if report["steps"]:
+        printout("# Run report #", effect=INVERSE)
+        total = sum(r["wall_s"] for r in report["steps"])
+        for r in sorted(report["steps"], key=lambda r: -r["wall_s"]):
+            print("#%2i. %-28s %9.1f s  %5.1f %%" % (r["step"], r["info"], r["wall_s"], 100 * r["wall_s"] / (total or 1)))
+        print("# report: %s" % os.path.join(CONF.output_dir, "run_report.json"))
+        calibrate(report, CONF.calibration)
+
+    printout("# Pipeline end #", effect=INVERSE)
+    if failed:
+        # callers such as batch_flights.py tell a failed run by its exit code
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,775 @@
+# -*- coding: utf-8 -*-
+# env/ANH3
+
+
+# author: arkriger - https://github.com/AdrianKriger/aerialPhotogrammetry101/tree/main/aerial101
+
+# - the raster half of the dtm/dsm procedure (https://github.com/khalhoz/geo1101-ahn3-GF-and-Interpolation),
+#   shared by every dataset:
+#     - dtm: delaunay triangulation with laplace interpolation (startin);
+#     - dsm: quad-based idw [and an optional pdal-idw (via gdal)]
+#     - loop, batch, block-streaming and tiled engines; GeoTIFF / COG writers
+#     - the ground TIN persisted (.npz) and reused across cell sizes and runs
+
+import json
+import hashlib
+import os
+import time
+import shutil
+import tempfile
+from datetime import timedelta
+import numpy as np
+
+from .cloud import PointStore, grid_params
+
+def ground_points(array):
+    """The X, Y, Z (n x 3) of the ground points of the classified cloud."""
+    array = array[(array['Classification'] == 2) & (array['Classification'] != 7)]#\
+                  #& (array['Coplanar'] != 0) & (array['Rank'] != 3)]
+    return np.vstack((array['X'], array['Y'], array['Z'])).T
+
+#-- bits per axis of the space-filling curve keys
+CURVE_BITS = 16
+#-- the default insertion order; morton keys are the cheapest and built the TINs fastest
+TIN_ORDER = 'morton'
+
+def morton_keys(ix, iy):
+    """Z-order keys of integer coordinates (< 2**CURVE_BITS): their bits interleaved."""
+    def spread(v):
+        v = v.astype(np.uint64)
+        for shift, mask in ((16, 0x0000FFFF0000FFFF), (8, 0x00FF00FF00FF00FF),
+                            (4, 0x0F0F0F0F0F0F0F0F), (2, 0x3333333333333333), (1, 0x5555555555555555)):
+            v = (v | (v << np.uint64(shift))) & np.uint64(mask)
+        return v
+    return spread(ix) | (spread(iy) << np.uint64(1))
+
+def hilbert_keys(ix, iy):
+    """Hilbert curve keys of integer coordinates (< 2**CURVE_BITS)."""
+    x, y = ix.astype(np.int64), iy.astype(np.int64)
+    n = 1 << CURVE_BITS
+    d = np.zeros(x.shape, dtype=np.int64)
+    s = n >> 1
+    while s > 0:
+        rx, ry = (x & s) > 0, (y & s) > 0
+        d += s * s * ((3 * rx) ^ ry)
+        #-- rotate the quadrant
+        flip = ~ry & rx
+        x = np.where(flip, n - 1 - x, x); y = np.where(flip, n - 1 - y, y)
+        swap = ~ry
+        x, y = np.where(swap, y, x), np.where(swap, x, y)
+        s >>= 1
+    return d
+
+def insertion_order(xy, order=TIN_ORDER):
+    """Order in which to insert the points in the TIN: along a 'hilbert'
+    or 'morton' (Z-order) curve, or 'raw' (as they come). Consecutive
+    points along a curve are neighbours, so startin's point location
+    walks stay short and cache-friendly.
+    """
+    if order == 'raw' or len(xy) == 0:
+        return np.arange(len(xy))
+    lo, span = xy.min(axis=0), np.ptp(xy, axis=0)
+    q = ((1 << CURVE_BITS) - 1) * (xy - lo) / np.where(span > 0, span, 1)
+    ix, iy = q[:, 0].astype(np.int64), q[:, 1].astype(np.int64)
+    keys = {"hilbert": hilbert_keys, "morton": morton_keys}[order](ix, iy)
+    return np.argsort(keys, kind='stable')
+
+def tin_key(pts):
+    """Hashes the ground points into the key of their persisted TIN."""
+    return hashlib.sha256(np.ascontiguousarray(pts).tobytes()).hexdigest()
+
+def tin_save(tin, fpath, key):
+    """Writes the TIN as an .npz of its vertices (float64 n x 3, without
+    startin's infinite vertex, in TIN_ORDER whatever order the TIN was
+    built in) and its triangles (uint32 m x 3, indices into those
+    vertices) with the key of the ground points it was built from, and
+    its snap tolerance.
+    """
+    pts = tin.points[1:]
+    order = insertion_order(pts[:, :2], TIN_ORDER)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(order.size)
+    triangles = rank[np.asarray(tin.triangles, dtype=np.int64) - 1].astype(np.uint32)
+    with open(fpath, 'wb') as f:
+        np.savez(f, vertices=pts[order], triangles=triangles, key=np.array(key),
+                 snap=np.array(tin.snap_tolerance))
+
+def tin_read(fpath):
+    """Returns the vertices, triangles and key of a persisted TIN."""
+    with np.load(fpath) as tin:
+        return tin['vertices'], tin['triangles'], str(tin['key'])
+
+class StoredTIN:
+    """A persisted TIN (see tin_save) laid out as a startin DT: points
+    with the infinite vertex as row 0, triangles indexing them, counter-
+    clockwise. The per-triangle engine ('startin-TINfill') runs on it
+    as it is, without startinpy; the others get a DT from startin_dt.
+    """
+    def __init__(self, vertices, triangles, snap_tolerance):
+        self.points = np.vstack((np.full((1, 3), np.inf), vertices))
+        self.triangles = np.asarray(triangles, dtype=np.int64).reshape(-1, 3) + 1
+        self.snap_tolerance = snap_tolerance
+        self.dt = None
+
+    def number_of_vertices(self):
+        return len(self.points) - 1
+
+    def convex_hull(self):
+        """The hull vertices counter-clockwise, as DT.convex_hull: the
+        triangle edges without a twin chained end to start.
+        """
+        n = len(self.points)
+        a = self.triangles[:, [1, 2, 0]].ravel()
+        b = self.triangles[:, [2, 0, 1]].ravel()
+        edge = ~np.isin(b * n + a, a * n + b)
+        succ = dict(zip(a[edge].tolist(), b[edge].tolist()))
+        ring = [a[edge][0]]
+        while succ[ring[-1]] != ring[0]:
+            ring.append(succ[ring[-1]])
+        return np.array(ring)
+
+    def write_obj(self, fpath):
+        """Writes the TIN as a Wavefront OBJ, as DT.write_obj."""
+        with open(fpath, 'w') as f:
+            np.savetxt(f, self.points[1:], fmt='v %.17g %.17g %.17g')
+            np.savetxt(f, self.triangles, fmt='f %d %d %d')
+
+def startin_dt(tin):
+    """The startin DT of a TIN: tin itself, or for a StoredTIN its
+    vertices inserted again (once, kept with it). startinpy cannot adopt
+    a triangulation; along their curve the insertion is quick.
+    """
+    if not isinstance(tin, StoredTIN):
+        return tin
+    if tin.dt is None:
+        import startinpy
+
+        tin.dt = startinpy.DT(); tin.dt.snap_tolerance = tin.snap_tolerance
+        tin.dt.insert(tin.points[1:])
+    return tin.dt
+
+def tin_load(fpath, key):
+    """Returns the persisted TIN at fpath as a StoredTIN if it was built
+    from the ground points of this key, else None.
+    """
+    if not os.path.exists(fpath):
+        return None
+    with np.load(fpath) as stored:
+        if str(stored['key']) != key or 'snap' not in stored.files:
+            return None
+        return StoredTIN(stored['vertices'], stored['triangles'], float(stored['snap']))
+
+def build_tin(pts, order=TIN_ORDER):
+    """Inserts the points into a new startin DT in the given insertion
+    order (see insertion_order). Returns the TIN and the seconds taken,
+    sorting included.
+    """
+    import startinpy
+
+    start = time.time()
+    tin = startinpy.DT(); tin.insert(pts[insertion_order(pts[:, :2], order)])
+    return tin, time.time() - start
+
+def ground_tin(array, fpath=None, order=TIN_ORDER):
+    """Triangulates the ground points of the classified cloud, inserted
+    in the given order. With an .npz fpath the TIN persisted there is
+    loaded (as a StoredTIN, no triangulation) when it was built from
+    the same ground points, else the new TIN is written to it; reports
+    which, and the time it took.
+    """
+    pts = ground_points(array)
+    if fpath is None:
+        return build_tin(pts, order)[0]
+    start = time.time()
+    key = tin_key(pts)
+    tin = tin_load(fpath, key)
+    if tin is not None:
+        print('tin loaded:', fpath, '-', str(timedelta(seconds=time.time() - start)))
+        return tin
+    tin, seconds = build_tin(pts, order)
+    tin_save(tin, fpath, key)
+    print('tin built (%s order):' % order, fpath, '-', str(timedelta(seconds=seconds)))
+    return tin
+
+def execute_startin(array, res, origin, size, method, tin=None):
+    """Takes the grid parameters and the ground points. Interpolates
+    either using the TIN-linear or the Laplace method. Uses a
+    -9999 no-data value. Fully based on the startin package.
+    An already built tin (see ground_tin) is used as is.
+    The cells are visited in serpentine order (see serpentine).
+    'startin-TINfill' rasterises the TIN-linear surface per triangle
+    instead (see execute_startin_fill).
+    """
+    if method == 'startin-TINfill':
+        return execute_startin_fill(array, res, origin, size, method, tin)
+    if tin is None:
+        tin = ground_tin(array)
+    dt = startin_dt(tin)
+    ras = np.zeros([res[1], res[0]])
+    if method == 'startin-TINlinear':
+        interpolant = {"method": "TIN"}
+    elif method == 'startin-Laplace':
+        interpolant = {"method": "Laplace"}
+    xs = np.arange(origin[0], origin[0] + res[0] * size, size)
+    yi = 0
+    for y in np.arange(origin[1], origin[1] + res[1] * size, size):
+        for xi in (range(xs.size) if yi % 2 == 0 else range(xs.size - 1, -1, -1)):
+            x = xs[xi]
+            #-- one location per DT.interpolate call (startinpy >= 0.10); nan outside the hull
+            z = dt.interpolate(interpolant, [[x, y]])[0]
+            ras[yi, xi] = -9999 if np.isnan(z) else z
+        yi += 1
+    return ras, tin
+
+def serpentine(rows, cols):
+    """Orders the (rows, cols) cells of a raster row by row with every
+    other row walked backwards. startin starts each point location walk
+    from the triangle it found last, so in this order every walk starts
+    next to its cell, at the row ends too (not a raster width away).
+    """
+    return np.lexsort((np.where(rows % 2 == 0, cols, -cols), rows))
+
+def grid_axes(res, origin, size):
+    """Returns the x and y coordinates at which the rasterisers evaluate
+    the surface. These are the very np.arange axes walked by the cell
+    loops (trimmed to the resolution) so that batched and looped
+    engines sample identical locations.
+    """
+    xs = np.arange(origin[0], origin[0] + res[0] * size, size)[:res[0]]
+    ys = np.arange(origin[1], origin[1] + res[1] * size, size)[:res[1]]
+    return xs, ys
+
+def hull_mask(hull, xs, ys, eps=1e-9):
+    """Takes a counter-clockwise convex hull (n x 2) and the raster axes.
+    Returns a boolean [len(ys), len(xs)] mask of the locations inside
+    (or within eps of) the hull. Every row of a convex polygon is a
+    single interval, so the mask is built row-wise with array operations.
+    """
+    a, b = hull, np.roll(hull, -1, axis=0)
+    lo = np.full(ys.size, -np.inf); hi = np.full(ys.size, np.inf)
+    for (ax, ay), (bx, by) in zip(a, b):
+        dy = by - ay
+        if dy == 0:
+            # horizontal edge: clips the rows beyond it entirely
+            out = ys < ay - eps if bx > ax else ys > ay + eps
+            lo[out], hi[out] = np.inf, -np.inf
+            continue
+        xc = ax + (ys - ay) * (bx - ax) / dy
+        # CCW: upward edges bound the right side, downward edges the left
+        if dy > 0: hi = np.minimum(hi, xc + eps)
+        else: lo = np.maximum(lo, xc - eps)
+    return (xs[None, :] >= lo[:, None]) & (xs[None, :] <= hi[:, None])
+
+class RasterBlocks:
+    """A raster produced lazily, block of rows by block of rows: iterating
+    yields (row offset, block) pairs; shape is the full [rows, cols].
+    write_geotiff and write_cog write it through windowed writes as the
+    blocks are produced, so the full grid is never held in memory.
+    """
+    def __init__(self, shape, blocks):
+        self.shape, self.blocks = shape, blocks
+
+    def __iter__(self):
+        return iter(self.blocks)
+
+def startin_blocks(tin, xs, ys, method, block=256):
+    """Evaluates the triangulation at the xs by ys raster locations and
+    yields the result a block of rows at a time. The locations of a
+    block are handed to the triangulation in a single DT.interpolate
+    call (startinpy >= 0.10), in serpentine order; locations outside
+    the convex hull are masked out beforehand and get -9999.
+    'startin-TINfill' fills each block from the triangles that reach
+    its rows instead (see fill_triangles).
+    """
+    if method == 'startin-TINfill':
+        #-- startin hands out the triangles of an empty TIN as 0 x 0
+        p = tin.points[np.asarray(tin.triangles, dtype=np.int64).reshape(-1, 3)]
+        lo, hi = p[:, :, 1].min(axis=1), p[:, :, 1].max(axis=1)
+        for r in range(0, ys.size, block):
+            yb = ys[r:r + block]
+            rows = (hi >= yb[0]) & (lo <= yb[-1])
+            yield r, fill_triangles(np.full([yb.size, xs.size], -9999.), p[rows], xs, yb)
+        return
+    if method == 'startin-TINlinear':
+        interpolant = {"method": "TIN"}
+    elif method == 'startin-Laplace':
+        interpolant = {"method": "Laplace"}
+    #-- too few (or only collinear) points: no triangle, all -9999
+    covered = len(tin.triangles) > 0
+    if covered:
+        hull = tin.points[tin.convex_hull()][:, :2]
+        dt = startin_dt(tin)
+    for r in range(0, ys.size, block):
+        ras = np.full([ys[r:r + block].size, xs.size], -9999.)
+        if covered:
+            yy, xx = np.nonzero(hull_mask(hull, xs, ys[r:r + block]))
+            order = serpentine(r + yy, xx)
+            yy, xx = yy[order], xx[order]
+            if xx.size:
+                locs = np.column_stack((xs[xx], ys[r:r + block][yy]))
+                z = dt.interpolate(interpolant, locs)
+                ras[yy, xx] = np.where(np.isnan(z), -9999, z)
+        yield r, ras
+
+def startin_grid(tin, xs, ys, method, block=256):
+    """Collects startin_blocks into the full raster."""
+    ras = np.empty([ys.size, xs.size])
+    for r, b in startin_blocks(tin, xs, ys, method, block):
+        ras[r:r + b.shape[0]] = b
+    return ras
+
+def execute_startin_batch(array, res, origin, size, method, block=256, tin=None):
+    """Batched counterpart of execute_startin, see startin_grid.
+    Identical to execute_startin: the same locations are handed to
+    DT.interpolate in the same serpentine order (startin's Laplace
+    depends on where its walk starts).
+    """
+    if tin is None:
+        tin = ground_tin(array)
+    xs, ys = grid_axes(res, origin, size)
+    return startin_grid(tin, xs, ys, method, block), tin
+
+def execute_startin_blocks(array, res, origin, size, method, block=256, tin=None):
+    """Block-streamed counterpart of execute_startin_batch: the TIN is
+    built straight away, the raster is returned as RasterBlocks that
+    are only computed while they are written.
+    """
+    if tin is None:
+        tin = ground_tin(array)
+    xs, ys = grid_axes(res, origin, size)
+    return RasterBlocks([res[1], res[0]], startin_blocks(tin, xs, ys, method, block)), tin
+
+#-- (triangle, cell centre) pairs tested at once by tin_fill; ~100 bytes each
+FILL_CHUNK = 1 << 20
+
+def triangle_cells(p, xs, ys, eps=1e-7):
+    """Takes the triangles' vertices (m x 3 x 3) and the raster axes.
+    Returns per triangle the first and last+1 row and column of the
+    cell centres its bounding box covers (empty when it covers none).
+    """
+    lo, hi = p[:, :, :2].min(axis=1), p[:, :, :2].max(axis=1)
+    c0, c1 = np.searchsorted(xs, lo[:, 0] - eps), np.searchsorted(xs, hi[:, 0] + eps, 'right')
+    r0, r1 = np.searchsorted(ys, lo[:, 1] - eps), np.searchsorted(ys, hi[:, 1] + eps, 'right')
+    return r0, r1, c0, c1
+
+def fill_triangles(ras, p, xs, ys, eps=1e-9, chunk=FILL_CHUNK):
+    """Writes into ras (len(ys) x len(xs)) the value of each triangle's
+    plane at the cell centres it covers, its edges included. Every cell
+    of every triangle's bounding box is tested at once with NumPy, a
+    chunk of (triangle, cell) pairs at a time; a cell on an edge shared
+    by two triangles gets the same value from either.
+    """
+    if not len(p): return ras
+    r0, r1, c0, c1 = triangle_cells(p, xs, ys)
+    w = c1 - c0
+    counts = np.where((r1 > r0) & (w > 0), (r1 - r0) * w, 0)
+    ts = np.nonzero(counts)[0]
+    cum = np.cumsum(counts[ts])
+    start = 0
+    while start < ts.size:
+        base = cum[start - 1] if start else 0
+        end = max(start + 1, int(np.searchsorted(cum, base + chunk, 'right')))
+        t, n = ts[start:end], counts[ts[start:end]]
+        #-- one (triangle, cell) pair per cell of each bounding box, row by row
+        tri = np.repeat(t, n)
+        k = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+        row, col = r0[tri] + k // w[tri], c0[tri] + k % w[tri]
+        a, b, c = p[tri, 0], p[tri, 1], p[tri, 2]
+        gx, gy = xs[col] - a[:, 0], ys[row] - a[:, 1]
+        ux, uy, vx, vy = b[:, 0] - a[:, 0], b[:, 1] - a[:, 1], c[:, 0] - a[:, 0], c[:, 1] - a[:, 1]
+        det = ux * vy - vx * uy
+        #-- barycentric coordinates: a + l1 (b - a) + l2 (c - a); degenerate triangles give nan
+        with np.errstate(divide='ignore', invalid='ignore'):
+            l1 = (gx * vy - vx * gy) / det
+            l2 = (ux * gy - gx * uy) / det
+        inside = (l1 >= -eps) & (l2 >= -eps) & (l1 + l2 <= 1 + eps)
+        z = a[:, 2] + l1 * (b[:, 2] - a[:, 2]) + l2 * (c[:, 2] - a[:, 2])
+        ras[row[inside], col[inside]] = z[inside]
+        start = end
+    return ras
+
+def tin_fill(vertices, triangles, xs, ys):
+    """Rasterises the TIN-linear surface triangle by triangle instead of
+    cell by cell (see fill_triangles), so no cell is ever located.
+    Cells no triangle covers (outside the convex hull) get -9999.
+    vertices is n x 3 and triangles m x 3 indices into it: tin.points
+    and tin.triangles, or a persisted TIN as returned by tin_read.
+    """
+    p = vertices[np.asarray(triangles, dtype=np.int64).reshape(-1, 3)]
+    return fill_triangles(np.full([ys.size, xs.size], -9999.), p, xs, ys)
+
+def execute_startin_fill(array, res, origin, size, method='startin-TINfill', tin=None):
+    """Per-triangle counterpart of execute_startin for the TIN-linear
+    surface ('startin-TINfill' or 'startin-TINlinear'), see tin_fill.
+    Laplace weighs the natural neighbours of each cell and has no
+    per-triangle form.
+    """
+    if method not in ('startin-TINfill', 'startin-TINlinear'):
+        raise ValueError("%s: only the TIN-linear surface is rasterised per triangle" % method)
+    if tin is None:
+        tin = ground_tin(array)
+    xs, ys = grid_axes(res, origin, size)
+    return tin_fill(tin.points, tin.triangles, xs, ys), tin
+
+#-- the cores this process may keep busy, set by batch_flights.py for each flight
+CPUS_ENV = "AERIAL101_CPUS"
+
+def cpu_budget():
+    """The cores granted through CPUS_ENV, None when not set."""
+    return int(os.environ.get(CPUS_ENV) or 0) or None
+
+def grid_sizes(array, sizes):
+    """Yields (size, res, origin) of the grid over the extent of the
+    cloud at each of the cell sizes.
+    """
+    extent = [[array['X'].min(), array['X'].max()],
+              [array['Y'].min(), array['Y'].max()]]
+    for size in sizes:
+        res, origin, _ = grid_params(extent, size)
+        yield size, res, origin
+
+def execute_startin_sizes(array, sizes, method, engine=execute_startin_blocks, tin=None):
+    """Rasterises one triangulation of the ground points at several
+    cell sizes over the extent of the cloud (see grid_sizes). Yields
+    (size, res, origin, raster) per size; the TIN (see ground_tin) is
+    built once.
+    """
+    if tin is None:
+        tin = ground_tin(array)
+    for size, res, origin in grid_sizes(array, sizes):
+        yield size, res, origin, engine(array, res, origin, size, method, tin=tin)[0]
+
+
+def execute_idwquad(array, res, origin, size,
+                    start_rk, pwr, minp, incr_rk, method, tolerance, maxiter):
+    """Creates a KD-tree representation of the tile's points and
+    executes a quadrant-based IDW algorithm on them. Although the
+    KD-tree is based on a C implementation, the rest is coded in
+    pure Python (below). Keep in mind that because of this, this
+    is inevitably slower than the rest of the algorithms here.
+    To optimise performance, one is advised to fine-tune the
+    parametrisation, especially tolerance and maxiter.
+    """
+    from scipy.spatial import cKDTree
+    
+    array = array[array['Classification'] != 7]
+    #array = array[(array['Classification'] == 1) & (array['Classification'] == 2)]
+    pts = np.vstack((array['X'], array['Y'], array['Z'])).T
+    ras = np.zeros([res[1], res[0]])
+    tree = cKDTree(np.array([pts[:,0], pts[:,1]]).transpose())
+    yi = 0
+    for y in np.arange(origin[1], origin[1] + res[1] * size, size):
+        xi = 0
+        for x in np.arange(origin[0], origin[0] + res[0] * size, size):
+            done, i, rk = False, 0, start_rk
+            while done == False:
+                if method == "radial":
+                    ix = tree.query_ball_point([x, y], rk, tolerance)
+                elif method == "k-nearest":
+                    ix = tree.query([x, y], rk, tolerance)[1]
+                xyp = pts[ix]
+                qs = [
+                        xyp[(xyp[:,0] < x) & (xyp[:,1] < y)],
+                        xyp[(xyp[:,0] > x) & (xyp[:,1] < y)],
+                        xyp[(xyp[:,0] < x) & (xyp[:,1] > y)],
+                        xyp[(xyp[:,0] > x) & (xyp[:,1] > y)]
+                     ]
+                if min(qs[0].size, qs[1].size,
+                       qs[2].size, qs[3].size) >= minp: done = True
+                elif i == maxiter:
+                    ras[yi, xi] = -9999; break
+                rk += incr_rk; i += 1
+            else:
+                asum, bsum = 0, 0
+                for pt in xyp:
+                    dst = np.sqrt((x - pt[0])**2 + (y - pt[1])**2)
+                    u, w = pt[2], 1 / dst ** pwr
+                    asum += u * w; bsum += w
+                    ras[yi, xi] = asum / bsum
+            xi += 1
+        yi += 1
+    return ras
+
+def idwquad_cells(tree, pts, locs, start_rk, pwr, minp, incr_rk, method,
+                  tolerance, maxiter):
+    """Quadrant-based IDW for an (m x 2) array of locations. One batched
+    KD-tree query serves every location; the quadrant test and the
+    weighting run as array operations over the (m x k) neighbour matrix.
+    Only the locations failing the minp test are queried again with
+    rk + incr_rk, up to maxiter times, after which they get -9999.
+    """
+    out = np.full(len(locs), -9999.)
+    todo, rk = np.arange(len(locs)), start_rk
+    for i in range(maxiter + 1):
+        if todo.size == 0: break
+        q = locs[todo]
+        if method == "radial":
+            nbrs = tree.query_ball_point(q, rk, tolerance)
+            cnt = np.array([len(n) for n in nbrs])
+            ix = np.zeros([q.shape[0], max(cnt.max(), 1)], dtype=np.intp)
+            valid = np.arange(ix.shape[1]) < cnt[:, None]
+            ix[valid] = np.concatenate(nbrs).astype(np.intp) if cnt.sum() else []
+        elif method == "k-nearest":
+            ix = tree.query(q, rk, tolerance)[1].reshape(q.shape[0], -1)
+            valid = ix < tree.n
+            ix = np.where(valid, ix, 0)
+        dx, dy = pts[ix, 0] - q[:, :1], pts[ix, 1] - q[:, 1:]
+        qs = np.stack([((dx < 0) & (dy < 0) & valid).sum(1),
+                       ((dx > 0) & (dy < 0) & valid).sum(1),
+                       ((dx < 0) & (dy > 0) & valid).sum(1),
+                       ((dx > 0) & (dy > 0) & valid).sum(1)])
+        # 3 * count: execute_idwquad compares the .size of n x 3 slices
+        done = 3 * qs.min(0) >= minp
+        if done.any():
+            d = valid[done]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                dst = np.sqrt(dx[done] ** 2 + dy[done] ** 2)
+                w = np.where(d, 1 / dst ** pwr, 0)
+                u = np.where(d, pts[ix[done], 2], 0)
+                out[todo[done]] = (u * w).sum(1) / w.sum(1)
+        todo = todo[~done]; rk += incr_rk
+    return out
+
+def idwquad_blocks(tree, pts, xs, ys, start_rk, pwr, minp, incr_rk, method,
+                   tolerance, maxiter, block=64):
+    """Runs idwquad_cells over the xs by ys raster locations and yields
+    the result a block of rows at a time, which also bounds the size
+    of the neighbour matrix.
+    """
+    for r in range(0, ys.size, block):
+        yy, xx = np.meshgrid(ys[r:r + block], xs, indexing='ij')
+        locs = np.column_stack((xx.ravel(), yy.ravel()))
+        yield r, idwquad_cells(tree, pts, locs, start_rk, pwr, minp,
+                               incr_rk, method, tolerance,
+                               maxiter).reshape(yy.shape)
+
+def idwquad_grid(tree, pts, xs, ys, start_rk, pwr, minp, incr_rk, method,
+                 tolerance, maxiter, block=64):
+    """Collects idwquad_blocks into the full raster."""
+    ras = np.empty([ys.size, xs.size])
+    for r, b in idwquad_blocks(tree, pts, xs, ys, start_rk, pwr, minp, incr_rk,
+                               method, tolerance, maxiter, block):
+        ras[r:r + b.shape[0]] = b
+    return ras
+
+def execute_idwquad_batch(array, res, origin, size,
+                          start_rk, pwr, minp, incr_rk, method, tolerance, maxiter,
+                          block=64):
+    """Vectorised counterpart of execute_idwquad with the same
+    parametrisation (start_rk, incr_rk, maxiter, tolerance from
+    params.json), see idwquad_cells.
+    """
+    from scipy.spatial import cKDTree
+
+    array = array[array['Classification'] != 7]
+    pts = np.vstack((array['X'], array['Y'], array['Z'])).T
+    tree = cKDTree(pts[:, :2])
+    xs, ys = grid_axes(res, origin, size)
+    return idwquad_grid(tree, pts, xs, ys, start_rk, pwr, minp, incr_rk,
+                        method, tolerance, maxiter, block)
+
+def execute_idwquad_blocks(array, res, origin, size,
+                           start_rk, pwr, minp, incr_rk, method, tolerance, maxiter,
+                           block=64):
+    """Block-streamed counterpart of execute_idwquad_batch, returning
+    RasterBlocks that are only computed while they are written.
+    """
+    from scipy.spatial import cKDTree
+
+    array = array[array['Classification'] != 7]
+    pts = np.vstack((array['X'], array['Y'], array['Z'])).T
+    tree = cKDTree(pts[:, :2])
+    xs, ys = grid_axes(res, origin, size)
+    return RasterBlocks([res[1], res[0]],
+                        idwquad_blocks(tree, pts, xs, ys, start_rk, pwr, minp, incr_rk,
+                                       method, tolerance, maxiter, block))
+
+def raster_tile(array, xs, ys, engine, jparams):
+    """Rasterises one tile: builds a local TIN (engine 'startin-Laplace',
+    'startin-TINlinear' or 'startin-TINfill') or KD-tree (engine 'idwquad') from the
+    points of the buffered tile extent and evaluates it at the tile's
+    xs by ys locations. Runs in a worker process of execute_tiled.
+    """
+    if engine == 'idwquad':
+        from scipy.spatial import cKDTree
+
+        array = array[array['Classification'] != 7]
+        if array.size == 0: return np.full([ys.size, xs.size], -9999.)
+        pts = np.vstack((array['X'], array['Y'], array['Z'])).T
+        return idwquad_grid(cKDTree(pts[:, :2]), pts, xs, ys,
+                            jparams["start_rk"], jparams["pwr"], jparams["minp"],
+                            jparams["incr_rk"], jparams["method"], jparams["tolerance"],
+                            jparams["maxiter"])
+    tin = ground_tin(array, order=jparams.get("tin-order", TIN_ORDER))
+    return startin_grid(tin, xs, ys, engine)
+
+def tile_points(array, xs, ys, t, buf):
+    """Yields (row, column, points) for the tiles of t by t cells of the
+    xs by ys axes, row by row, with the points of the tile's extent
+    grown by buf (metres). The points are binned once by the tile they
+    fall in (a sort on the tile index); each tile gathers the bins its
+    buffered extent reaches and trims them to that extent, so the cloud
+    is scanned once and only one tile's points are copied at a time.
+    """
+    x, y = array['X'], array['Y']
+    #-- the first axis value of every tile but the first: the bin edges
+    ex, ey = xs[t::t], ys[t::t]
+    key = np.searchsorted(ey, y, 'right') * (ex.size + 1) + np.searchsorted(ex, x, 'right')
+    order = np.argsort(key, kind='stable')
+    key = key[order]
+    for r in range(0, ys.size, t):
+        tys = ys[r:r + t]
+        r0, r1 = np.searchsorted(ey, [tys[0] - buf, tys[-1] + buf], 'right')
+        for c in range(0, xs.size, t):
+            txs = xs[c:c + t]
+            c0, c1 = np.searchsorted(ex, [txs[0] - buf, txs[-1] + buf], 'right')
+            lo = np.searchsorted(key, np.arange(r0, r1 + 1) * (ex.size + 1) + c0)
+            hi = np.searchsorted(key, np.arange(r0, r1 + 1) * (ex.size + 1) + c1, 'right')
+            #-- in cloud order, as a selection of the whole array would give them
+            idx = np.sort(np.concatenate([order[i:j] for i, j in zip(lo, hi)]))
+            sel = ((x[idx] >= txs[0] - buf) & (x[idx] <= txs[-1] + buf) &
+                   (y[idx] >= tys[0] - buf) & (y[idx] <= tys[-1] + buf))
+            yield r, c, array[idx[sel]]
+
+def tiled_blocks(array, xs, ys, engine, jparams):
+    """Rasterises the tiles of tile_points in a pool of jparams["workers"]
+    processes (see raster_tile), with no more than two tiles per worker
+    in flight, and yields each band of t rows once all its tiles are in.
+    """
+    from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+    t, workers = jparams["tile-size"], jparams["workers"]
+    tiles = tile_points(array, xs, ys, t, jparams["tile-buffer"])
+    bands, left, running = {}, {}, {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while True:
+            for r, c, pts in tiles:
+                running[pool.submit(raster_tile, pts, xs[c:c + t], ys[r:r + t], engine, jparams)] = (r, c)
+                if len(running) >= 2 * workers:
+                    break
+            if not running:
+                return
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for job in done:
+                r, c = running.pop(job)
+                if r not in bands:
+                    bands[r], left[r] = np.empty([ys[r:r + t].size, xs.size]), -(-xs.size // t)
+                bands[r][:, c:c + t] = job.result()
+                left[r] -= 1
+                if not left[r]:
+                    del left[r]
+                    yield r, bands.pop(r)
+
+def execute_tiled(array, res, origin, size, engine, jparams):
+    """Splits the grid into tiles of jparams["tile-size"] cells, each
+    with a jparams["tile-buffer"] (metres) overlap of points around it,
+    and rasterises them in a pool of jparams["workers"] processes (see
+    tiled_blocks). Returns RasterBlocks, a band of tiles at a time, that
+    are only computed while they are written. Away from numerical noise
+    this equals the single-process engines as long as the buffer holds
+    every natural neighbour (or quadrant neighbour) of the tile's
+    cells; note a non-zero tolerance makes the k-nearest query
+    approximate and thus dependent on the (local) tree.
+    """
+    xs, ys = grid_axes(res, origin, size)
+    return RasterBlocks([res[1], res[0]], tiled_blocks(array, xs, ys, engine, jparams))
+
+def write_geotiff(raster, origin, size, crs, fpath, **creation):
+    """Writes the interpolated TIN-linear and Laplace rasters
+    to disk using the GeoTIFF format. The header is based on
+    the raster array and a manual definition of the coordinate
+    system and an identity affine transform.
+    ~ raster is the full array or RasterBlocks, whose blocks are
+    converted and written window by window as they are produced
+    """
+    import rasterio
+    from rasterio.transform import Affine
+    from rasterio.windows import Window
+    transform = (Affine.translation(origin[0], origin[1])
+                 * Affine.scale(size, size))
+    blocks = [(0, raster)] if isinstance(raster, np.ndarray) else raster
+    #raster  = np.flip(raster, 0)
+    with rasterio.Env():
+        with rasterio.open(fpath, 'w', driver = 'GTiff',
+                           height = raster.shape[0],
+                           width = raster.shape[1],
+                           count = 1,
+                           dtype = rasterio.float32,
+                           crs = crs,
+                           #crs = '+proj=utm +zone=3 +ellps=WGS84 +datum=WGS84 +units=m +no_defs',
+                           transform = transform,
+                           **creation
+                           ) as out_file:
+            for r, block in blocks:
+                out_file.write(block.astype(rasterio.float32), 1,
+                               window = Window(0, r, raster.shape[1], block.shape[0]))
+
+def write_cog(raster, origin, size, crs, fpath, compress, blocksize, overviews):
+    """Writes the raster (array or RasterBlocks) as a Cloud-Optimized
+    GeoTIFF: internally tiled (blocksize), compressed (DEFLATE, ZSTD,
+    LERC, ...) and with internal overviews ('AUTO' or 'NONE'), tagged
+    with nodata -9999. Same georeferencing as write_geotiff. The raster
+    is staged block by block in a tiled GeoTIFF in a private folder next
+    to fpath, which GDAL's COG driver (GDAL >= 3.1) then lays out; the
+    folder is removed however the write ends.
+    """
+    import rasterio
+    from rasterio.shutil import copy as rio_copy
+    tdir = tempfile.mkdtemp(prefix='cog_', dir=os.path.dirname(fpath) or '.')
+    try:
+        tmp = os.path.join(tdir, 'staged.tif')
+        write_geotiff(raster, origin, size, crs, tmp, nodata = -9999, tiled = True,
+                      blockxsize = blocksize, blockysize = blocksize)
+        with rasterio.Env():
+            rio_copy(tmp, fpath, driver = 'COG',
+                     compress = compress,
+                     predictor = 'YES' if compress in ('DEFLATE', 'ZSTD') else 'NO',
+                     blocksize = blocksize,
+                     overviews = overviews,
+                     resampling = 'AVERAGE')
+    finally:
+        shutil.rmtree(tdir, ignore_errors=True)
+
+def write_raster(raster, origin, size, crs, fpath, jparams):
+    """Writes the raster with write_cog when jparams["tif-format"] is
+    "COG" (options "tif-compress", "tif-blocksize", "tif-overviews"),
+    with write_geotiff otherwise.
+    """
+    if jparams["tif-format"] == "COG":
+        write_cog(raster, origin, size, crs, fpath, jparams["tif-compress"],
+                  jparams["tif-blocksize"], jparams["tif-overviews"])
+    else:
+        write_geotiff(raster, origin, size, crs, fpath)
+
+def pdal_idw(array, res, origin, name, jparams):
+    """Sets up a PDAL pipeline that reads a ground filtered LAS
+    file, and writes it via GDAL. The GDAL writer has interpolation
+    options, exposing the radius, power and a fallback kernel width
+    to be configured. More about these in the readme on GitHub.
+    """
+    import pdal
+    pline={
+        "pipeline": [
+            {
+                "type":"writers.gdal",
+                "filename": jparams['dtm_dsm'] + name + '_idwPDAL.tif',
+                "resolution": jparams['size'],
+                "radius": jparams['pdal-idw-rad'],
+                "power": jparams['pdal-idw-pow'],
+                "window_size": jparams['pdal-idw-wnd'],
+                "output_type": "idw",
+                "nodata": -9999,
+                "dimension": "Z",
+                "origin_x":  origin[0],
+                "origin_y":  origin[1],
+                "width":  res[0],
+                "height": res[1]
+            },
+          ]
+        } 
+    
+    if isinstance(array, PointStore):
+        array = array.structured()
+    p = pdal.Pipeline(json.dumps(pline), [array])
+    #pipeline.validate() 
+    p.execute()
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+# env/AHN3
+
+# - process many flights in one invocation; for each flight of a manifest:
+#     - MvgMvsPipeline_*.py of its dataset folder: input_dir -> output_dir (SfM-MVS)
+#     - *_Main.py of its dataset folder with the flight's params file, run from the folder of that file (DTM/DSM)
+# - whole flights run side by side in a worker pool sharing a global core budget;
+#   the DTM/DSM stage is held to the flight's share through AERIAL101_CPUS
+# - while they run, one line every 30 s gives the progress of every flight (from its output_dir/progress.json)
+# - a consolidated timing summary is printed and written next to the manifest
+#
+# -- python batch_flights.py flights.json
+#
+# flights.json (paths relative to the manifest):
+# {"cpu-budget": 32, "workers": 4,
+#  "flights": [{"name": "morges", "dataset": "SenseMor_127",
+#               "input_dir": "senseFly_127/images", "output_dir": "senseFly_127/result_utm",
+#               "params": "senseFly_127/params.json", "preset": "SEQ_geo"},
+#              {"name": "echallens", "dataset": "Pix4Echa_100", "input_dir": "...", "output_dir": "...",
+#               "runner-args": ["--profile", "node"], "raster": false}]}
+# "sfm-mvs": false skips the runner, "raster": false the DTM/DSM of a flight
+
+import os
+import sys
+import csv
+import glob
+import json
+import time
+import argparse
+import subprocess
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from aerial101.pipeline import available_cpus
+from aerial101.raster import CPUS_ENV
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+# seconds between two progress lines
+MONITOR_INTERVAL = 30
+
+
+def scripts(dataset):
+    """The runner and *_Main.py of a dataset folder"""
+    folder = os.path.join(ROOT, dataset)
+    runner = glob.glob(os.path.join(folder, 'MvgMvsPipeline_*.py'))
+    main = glob.glob(os.path.join(folder, '*_Main.py'))
+    if not runner or not main:
+        raise ValueError("%s: no MvgMvsPipeline_*.py / *_Main.py" % folder)
+    return runner[0], main[0]
+
+
+def run(cmdline, cwd, log, env=None):
+    """Run cmdline from cwd with its output in the log file; return exit code and seconds"""
+    start = time.perf_counter()
+    with open(log, 'w') as f:
+        code = subprocess.call(cmdline, cwd=cwd, stdout=f, stderr=subprocess.STDOUT,
+                               stdin=subprocess.DEVNULL, env=env)
+    return code, time.perf_counter() - start
+
+
+def slowest_step(output_dir):
+    """'#N info (seconds)' of the slowest step in the runner's run_report.json, None if absent"""
+    try:
+        with open(os.path.join(output_dir, "run_report.json")) as f:
+            steps = json.load(f)["steps"]
+    except (OSError, ValueError, KeyError):
+        return None
+    if not steps:
+        return None
+    s = max(steps, key=lambda s: s["wall_s"])
+    return "#%i %s (%.0f s)" % (s["step"], s["info"], s["wall_s"])
+
+
+def flight_progress(flight, base):
+    """'name 3/9 #12. Densify point cloud 45% ETA 0:10:00' from the runner's progress.json of a flight, None if absent"""
+    try:
+        with open(os.path.join(base, flight["output_dir"], "progress.json")) as f:
+            status = json.load(f)
+    except (OSError, ValueError):
+        return None
+    running = ", ".join("%s %s" % (r["label"], "%.0f%%" % r["percent"] if r["percent"] is not None else "")
+                        for r in status["running"])
+    eta = " ETA %s" % timedelta(seconds=status["eta_s"]) if status.get("eta_s") is not None else ""
+    return "%s %i/%i%s%s" % (flight["name"], status["steps_done"], status["steps_total"],
+                             " " + running if running else "", eta)
+
+
+def process(flight, cpus, base):
+    """SfM-MVS then DTM/DSM for one flight of the manifest; return its summary record"""
+    path = lambda p: os.path.join(base, p)
+    runner, main = scripts(flight["dataset"])
+    output_dir = path(flight["output_dir"])
+    os.makedirs(output_dir, exist_ok=True)
+    record = {"name": flight["name"], "dataset": flight["dataset"], "cpus": cpus,
+              "sfm_mvs_s": None, "raster_s": None, "status": "ok", "slowest_step": None}
+
+    if flight.get("sfm-mvs", True):
+        cmdline = [sys.executable, runner, path(flight["input_dir"]), output_dir, "--cpu-budget", str(cpus)]
+        if "preset" in flight:
+            cmdline += ["--preset", flight["preset"]]
+        if "steps" in flight:
+            cmdline += ["--steps"] + [str(s) for s in flight["steps"]]
+        cmdline += flight.get("runner-args", [])
+        code, record["sfm_mvs_s"] = run(cmdline, output_dir, os.path.join(output_dir, "batch_sfm_mvs.log"))
+        record["slowest_step"] = slowest_step(output_dir)
+        if code != 0:
+            record["status"] = "sfm-mvs failed (%i)" % code
+            return record
+
+    if flight.get("raster", True) and "params" in flight:
+        #-- *_Main.py takes the params file; the paths in it are relative to its folder
+        params = os.path.abspath(path(flight["params"]))
+        #-- caps "workers" and "pdal-workers" of the flight (aerial101.raster.cpu_budget)
+        env = dict(os.environ, **{CPUS_ENV: str(cpus)})
+        code, record["raster_s"] = run([sys.executable, main, params], os.path.dirname(params),
+                                       os.path.join(output_dir, "batch_raster.log"), env)
+        if code != 0:
+            record["status"] = "raster failed (%i)" % code
+    return record
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the SfM-MVS and DTM/DSM scripts over a manifest of flights.")
+    parser.add_argument('manifest', help="JSON file of the flights (see the head of this script)")
+    parser.add_argument('--cpu-budget', type=int, help="cores shared by all flights (default: manifest, else all)")
+    parser.add_argument('--workers', type=int, help="flights processed at the same time (default: manifest, else 1)")
+    parser.add_argument('--summary', help="summary file, .json and .csv written (default: next to the manifest)")
+    args = parser.parse_args()
+
+    with open(args.manifest) as f:
+        manifest = json.load(f)
+    base = os.path.dirname(os.path.abspath(args.manifest))
+    flights = manifest["flights"]
+    if not flights:
+        sys.exit("%s: no flights" % args.manifest)
+    budget = args.cpu_budget or manifest.get("cpu-budget") or available_cpus()
+    workers = max(1, min(len(flights), args.workers or manifest.get("workers", 1)))
+    #-- every flight runs its steps within its share of the cores
+    cpus = max(1, budget // workers)
+    print("# %i flights, %i at a time with %i cores each" % (len(flights), workers, cpus))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(process, flight, cpus, base): i for i, flight in enumerate(flights)}
+        records = [None] * len(flights)
+        pending = set(futures)
+        while pending:
+            finished, pending = wait(pending, timeout=MONITOR_INTERVAL)
+            for future in finished:
+                flight = flights[futures[future]]
+                try:
+                    r = future.result()
+                except Exception as e:
+                    r = {"name": flight.get("name"), "dataset": flight.get("dataset"), "cpus": cpus,
+                         "sfm_mvs_s": None, "raster_s": None,
+                         "status": "%s: %s" % (type(e).__name__, e), "slowest_step": None}
+                records[futures[future]] = r
+                print("# %s done: %s" % (r["name"], r["status"]))
+            lines = [flight_progress(flights[futures[f]], base) for f in pending]
+            if any(lines):
+                print("# " + " | ".join(l for l in lines if l), flush=True)
+    total = time.perf_counter() - start
+
+    fmt = lambda s: '-' if s is None else str(timedelta(seconds=round(s)))
+    print("\n%-16s %-14s %10s %10s  %-32s %s" % ("flight", "dataset", "sfm-mvs", "raster", "slowest step", "status"))
+    for r in records:
+        print("%-16s %-14s %10s %10s  %-32s %s" % (r["name"], r["dataset"], fmt(r["sfm_mvs_s"]), fmt(r["raster_s"]),
+                                                  r["slowest_step"] or '-', r["status"]))
+    print("total: %s for %i flights" % (fmt(total), len(records)))
+
+    summary = args.summary or os.path.join(base, "batch_summary.json")
+    stem = os.path.splitext(summary)[0]
+    with open(stem + ".json", 'w') as f:
+        json.dump({"cpu-budget": budget, "workers": workers, "total_s": total, "flights": records}, f, indent=1)
+    with open(stem + ".csv", 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(records[0]))
+        writer.writeheader()
+        writer.writerows(records)
+    print("summary: %s(.csv)" % (stem + ".json"))
+    sys.exit(0 if all(r["status"] == "ok" for r in records) else 1)
+
+
+if __name__ == "__main__":
+    main()
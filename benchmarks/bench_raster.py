@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+# env/AHN3
+
+# - benchmark the DTM/DSM engines of the shared aerial101 package on synthetic terrain:
+#     - terrain: planar, hilly or quarry-like steps; uniform or clustered density
+#     - engines: execute_startin (loop, batch), execute_idwquad (loop, batch), pdal_idw
+#     - the ground TIN build alone, per insertion order: raw, morton, hilbert (tin-*)
+#     - TIN-linear per cell (tinlinear-batch) against per triangle, vectorised (tinlinear-fill)
+#     - Laplace by startin (startin-batch) against NumPy natural neighbours in threads (laplace-bulk)
+#     - or the classified cloud of a dataset: the PointStore its "cache" wrote (--store)
+# - every case runs in a fresh process so its peak memory can be read back
+# - results are appended to a JSON file; the previous run in it is used for comparison
+#
+# -- python benchmarks/bench_raster.py --points 10000 100000 --sizes 1 0.5 --terrain hilly quarry
+# -- python benchmarks/bench_raster.py --engines tin-raw tin-morton tin-hilbert --store ../SenseMor_127/result_utm/las/sceneGeo_dense_store
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import multiprocessing
+from datetime import datetime
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+ENGINES = ['startin-loop', 'startin-batch', 'idwquad-loop', 'idwquad-batch', 'pdal-idw',
+           'tin-raw', 'tin-morton', 'tin-hilbert', 'tinlinear-batch', 'tinlinear-fill']
+
+#-- execute_idwquad parametrisation as in params.json
+IDW = {"start_rk": 10, "pwr": 2, "minp": 2, "incr_rk": 3, "method": "k-nearest",
+       "tolerance": 0.5, "maxiter": 100}
+
+
+def terrain(kind, n, area, density='uniform', seed=0):
+    """Generates a synthetic classified cloud of n points over an area x area
+    square as a PDAL-style structured array (X, Y, Z, Classification):
+        - ground (2) on a planar, hilly or quarry-like (terraced) surface;
+        - non-ground (1): box-shaped 'buildings' and noisy 'vegetation'
+          above the ground, ~20% of the points;
+        - low noise (7), ~1% of the points.
+    A 'clustered' density draws the xy from a few Gaussian blobs, mimicking
+    the uneven density of MVS clouds.
+    """
+    rng = np.random.default_rng(seed)
+    if density == 'clustered':
+        centres = rng.uniform(0, area, (8, 2))
+        xy = centres[rng.integers(0, 8, n)] + rng.normal(0, area / 8, (n, 2))
+        xy = np.mod(xy, area)
+    else:
+        xy = rng.uniform(0, area, (n, 2))
+    x, y = xy[:, 0], xy[:, 1]
+    if kind == 'planar':
+        z = 0.02 * x + 0.01 * y
+    elif kind == 'hilly':
+        z = 8 * np.sin(x / 25) * np.cos(y / 30) + 0.05 * x
+    elif kind == 'quarry':
+        #-- concentric benches of 4 m stepping down to the pit centre
+        r = np.hypot(x - area / 2, y - area / 2)
+        z = 4 * np.floor(r / 12) + 0.2 * np.mod(r, 12)
+    z = z + rng.normal(0, 0.05, n)
+    cls = np.full(n, 2, dtype=np.uint8)
+    above = rng.random(n) < 0.2
+    z[above] += rng.choice([3, 6, 10], above.sum()) * rng.random(above.sum())
+    cls[above] = 1
+    noise = rng.random(n) < 0.01
+    z[noise] -= rng.uniform(2, 10, noise.sum())
+    cls[noise] = 7
+
+    array = np.empty(n, dtype=[('X', '<f8'), ('Y', '<f8'), ('Z', '<f8'),
+                               ('Classification', 'u1')])
+    array['X'], array['Y'], array['Z'], array['Classification'] = x, y, z, cls
+    return array
+
+
+def peak_rss():
+    """Peak resident memory of this process in bytes, None where unknown."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    #-- ru_maxrss is in KiB on linux and bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+def run_case(case):
+    """Runs one engine on one synthetic cloud and returns its timing,
+    throughput and peak memory (not available on Windows). Executed in
+    a fresh (spawned) process.
+    """
+    import aerial101 as code
+    if 'store' in case:
+        array = code.open_store(case['store'])
+    else:
+        array = terrain(case['terrain'], case['points'], case['area'], case['density'])
+    extent = [[array['X'].min(), array['X'].max()], [array['Y'].min(), array['Y'].max()]]
+    res, origin, _ = code.grid_params(extent, case['size'])
+    base = peak_rss()
+
+    start = time.perf_counter()
+    engine = case['engine']
+    if engine == 'startin-loop':
+        code.execute_startin(array, res, origin, case['size'], method='startin-Laplace')
+    elif engine == 'startin-batch':
+        code.execute_startin_batch(array, res, origin, case['size'], method='startin-Laplace')
+    elif engine == 'idwquad-loop':
+        code.execute_idwquad(array, res, origin, case['size'], **IDW)
+    elif engine == 'idwquad-batch':
+        code.execute_idwquad_batch(array, res, origin, case['size'], **IDW)
+    elif engine == 'tinlinear-batch':
+        code.execute_startin_batch(array, res, origin, case['size'], method='startin-TINlinear')
+    elif engine == 'tinlinear-fill':
+        code.execute_startin_batch(array, res, origin, case['size'], method='startin-TINfill')
+    elif engine.startswith('tin-'):
+        #-- the triangulation alone, its points inserted in this order
+        code.build_tin(code.ground_points(array), engine[len('tin-'):])
+    elif engine == 'pdal-idw':
+        with tempfile.TemporaryDirectory() as tmp:
+            jparams = {"dtm_dsm": tmp + os.sep, "size": case['size'],
+                       "pdal-idw-rad": 3, "pdal-idw-pow": 1, "pdal-idw-wnd": 3}
+            code.pdal_idw(array[array['Classification'] != 7], res, origin, 'bench', jparams)
+    seconds = time.perf_counter() - start
+
+    peak = peak_rss()
+    return dict(case, cells=res[0] * res[1], seconds=seconds,
+                cells_per_s=res[0] * res[1] / seconds,
+                points_per_s=case['points'] / seconds,
+                peak_rss_mb=peak and peak / 2**20,
+                engine_rss_mb=peak and (peak - base) / 2**20)
+
+
+def isolated(case):
+    """Runs run_case in its own spawned process so that peak memory is per case.
+    Returns the error instead of a result when the engine cannot run here
+    (e.g. a missing optional dependency or an older startinpy API).
+    """
+    ctx = multiprocessing.get_context('spawn')
+    with ctx.Pool(1) as pool:
+        try:
+            return pool.apply(run_case, (case,))
+        except Exception as e:
+            return dict(case, error='%s: %s' % (type(e).__name__, e))
+
+
+def compare(results, previous):
+    """Prints each case's throughput against the same case of the previous run."""
+    def key(r): return tuple(r[k] for k in ('engine', 'terrain', 'density', 'points', 'size'))
+    before = {key(r): r for r in previous.get('results', []) if 'seconds' in r}
+    for r in results:
+        if 'seconds' not in r:
+            print('%-14s %-7s %8d pts %5.2f m  -- %s' % (r['engine'], r['terrain'], r['points'],
+                                                      r['size'], r['error']))
+            continue
+        line = '%-14s %-7s %8d pts %5.2f m  %9.3f s %12.0f cells/s %10.0f pts/s %8s MB' % (
+            r['engine'], r['terrain'], r['points'], r['size'], r['seconds'],
+            r['cells_per_s'], r['points_per_s'],
+            '-' if r['peak_rss_mb'] is None else '%.1f' % r['peak_rss_mb'])
+        if key(r) in before:
+            line += '  x%.2f vs previous' % (before[key(r)]['seconds'] / r['seconds'])
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the DTM/DSM engines on synthetic terrain.")
+    parser.add_argument('--engines', nargs='+', default=ENGINES, choices=ENGINES)
+    parser.add_argument('--terrain', nargs='+', default=['planar', 'hilly', 'quarry'],
+                        choices=['planar', 'hilly', 'quarry'])
+    parser.add_argument('--density', nargs='+', default=['uniform'], choices=['uniform', 'clustered'])
+    parser.add_argument('--points', nargs='+', type=int, default=[10000, 100000])
+    parser.add_argument('--sizes', nargs='+', type=float, default=[1.0, 0.5],
+                        help="raster cell sizes (m)")
+    parser.add_argument('--area', type=float, default=200, help="side of the square site (m)")
+    parser.add_argument('--store', nargs='+', default=[],
+                        help="classified cloud PointStore(s) of a dataset, used instead of the synthetic terrain")
+    parser.add_argument('--out', default=os.path.join(ROOT, 'benchmarks', 'results.json'),
+                        help="JSON file the run is appended to")
+    args = parser.parse_args()
+
+    results = []
+    for store in args.store:
+        import aerial101 as code
+        n = len(code.open_store(store))
+        for s in args.sizes:
+            for e in args.engines:
+                results.append(isolated(dict(engine=e, terrain=os.path.basename(os.path.normpath(store)),
+                                             density='store', points=n, size=s, area=None, store=store)))
+    for t in ([] if args.store else args.terrain):
+        for d in args.density:
+            for n in args.points:
+                for s in args.sizes:
+                    for e in args.engines:
+                        results.append(isolated(dict(engine=e, terrain=t, density=d, points=n,
+                                                     size=s, area=args.area)))
+
+    runs = []
+    if os.path.exists(args.out):
+        with open(args.out) as f:
+            runs = json.load(f)
+    compare(results, runs[-1] if runs else {})
+    runs.append({"date": datetime.now().isoformat(timespec='seconds'),
+                 "host": platform.node(), "python": platform.python_version(),
+                 "numpy": np.__version__, "results": results})
+    with open(args.out, 'w') as f:
+        json.dump(runs, f, indent=1)
+    print('results appended to', args.out)
+
+
+if __name__ == "__main__":
+    main()